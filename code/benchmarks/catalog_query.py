@@ -0,0 +1,55 @@
+# Measures top-k recommendation latency of the offline music catalog on a
+# synthetic catalog of random tracks, checking every answer against a brute
+# force search over all tracks.
+# Usage: python code/benchmarks/catalog_query.py --tracks 1000000 --k 10
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine.catalog import MusicCatalog, mood_point
+from engine.config import EMOTIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline catalog recommendations')
+    parser.add_argument('--tracks', type=int, default=1000000, help='tracks in the synthetic catalog')
+    parser.add_argument('--k', type=int, default=10, help='tracks per recommendation')
+    parser.add_argument('--queries', type=int, default=2000, help='timed queries')
+    parser.add_argument('--grid', type=int, default=64, help='index cells per axis')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    valence = rng.random(args.tracks, dtype=np.float32)
+    arousal = rng.random(args.tracks, dtype=np.float32)
+    ids = np.arange(args.tracks).astype(str)
+    empty = np.full(args.tracks, '', dtype=object)
+    start = time.perf_counter()
+    catalog = MusicCatalog(ids, empty, empty, empty, valence, arousal, grid=args.grid)
+    print(f"Built an index of {args.tracks} tracks in {time.perf_counter() - start:.2f}s")
+
+    # Softmax-like mood vectors, as the model produces them
+    moods = rng.dirichlet(np.full(len(EMOTIONS), 0.5), size=args.queries).astype(np.float32)
+
+    for mood in moods[:20]:
+        point = mood_point(mood)
+        expected = np.sort(np.hypot(catalog.valence - point[0], catalog.arousal - point[1]))[:args.k]
+        found = [track.distance for track in catalog.recommend(mood, args.k)]
+        np.testing.assert_allclose(found, expected, atol=1e-5)
+
+    timings = []
+    for mood in moods:
+        start = time.perf_counter()
+        catalog.recommend(mood, args.k)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings = np.array(timings)
+    print(f"top-{args.k}: mean {timings.mean():.3f} ms   p50 {np.percentile(timings, 50):.3f} ms   "
+          f"p99 {np.percentile(timings, 99):.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Compares the face detectors on a local, labelled test set: time per image,
+# recall and precision of the detected boxes against the annotated faces.
+# The annotations are a CSV with one face per row: image,x,y,w,h
+# (images without faces may appear once with empty box fields).
+# Usage: python code/benchmarks/face_detectors.py --images testset/ --annotations testset/faces.csv
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import defaultdict
+
+import cv2
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import DETECTORS, create_detector
+from engine.tracking import box_iou
+
+
+def load_annotations(path):
+    faces = defaultdict(list)
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            boxes = faces[row['image']]
+            if row.get('w'):
+                boxes.append(tuple(int(float(row[key])) for key in ('x', 'y', 'w', 'h')))
+    return faces
+
+
+def match(detected, expected, min_iou):
+    """Count the expected faces matched by a detection, each detection matching at most one face."""
+    unmatched = list(detected)
+    found = 0
+    for face in expected:
+        best = max(unmatched, key=lambda box: box_iou(box, face), default=None)
+        if best is not None and box_iou(best, face) >= min_iou:
+            unmatched.remove(best)
+            found += 1
+    return found
+
+
+def evaluate(detect, images, annotations, min_iou):
+    elapsed = 0.0
+    expected = detected = found = 0
+    for name, gray in images:
+        start = time.perf_counter()
+        boxes = detect(gray)
+        elapsed += time.perf_counter() - start
+        faces = annotations[name]
+        expected += len(faces)
+        detected += len(boxes)
+        found += match(boxes, faces, min_iou)
+    return {
+        'ms_per_image': elapsed * 1000.0 / len(images),
+        'images_per_s': len(images) / elapsed if elapsed else 0.0,
+        'recall': found / expected if expected else 0.0,
+        'precision': found / detected if detected else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark face detectors for speed and recall')
+    parser.add_argument('--images', required=True, help='folder with the test images')
+    parser.add_argument('--annotations', required=True, help='CSV with image,x,y,w,h rows')
+    parser.add_argument('--detectors', nargs='+', default=list(DETECTORS), choices=list(DETECTORS))
+    parser.add_argument('--min-iou', type=float, default=0.5, help='IoU for a detection to count as a hit')
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.annotations)
+    # Decode everything up front so only detection is timed
+    images = []
+    for name in sorted(annotations):
+        gray = cv2.imread(os.path.join(args.images, name), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"Skipping unreadable image {name}")
+            continue
+        images.append((name, gray))
+    if not images:
+        raise SystemExit("No test images could be read")
+
+    print(f"{len(images)} images, {sum(len(annotations[name]) for name, _ in images)} faces")
+    print(f"{'detector':<10}{'ms/image':>10}{'images/s':>10}{'recall':>9}{'precision':>11}")
+    for name in args.detectors:
+        try:
+            detect = create_detector(name)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"{name:<10}skipped: {e}")
+            continue
+        detect(images[0][1])  # warm-up
+        result = evaluate(detect, images, annotations, args.min_iou)
+        print(f"{name:<10}{result['ms_per_image']:>10.1f}{result['images_per_s']:>10.1f}"
+              f"{result['recall']:>9.3f}{result['precision']:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# Compares moving frames from a capture process to a consumer process through
+# a pipe as multiprocessing.Queue does it (pickled, copied through a pipe)
+# against the shared-memory SharedFrameRing (written once, read in place).
+# Every copy is made explicitly and counted with the size of what it wrote, so
+# the bytes and copies per frame are measured rather than assumed.
+# Usage: python code/benchmarks/frame_transport.py --frames 300 --width 1280 --height 720
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import SharedFrameRing
+
+
+def touch(frame):
+    """Read every byte of the frame, like a consumer that processes the whole image."""
+    return int(frame.sum(dtype=np.uint64))
+
+
+def produce_queue(conn, shape, count, copied):
+    frame = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    for i in range(count):
+        frame[0, 0, 0] = i % 256
+        # What Queue.put does in its feeder thread: pickle the frame, then write it to the pipe
+        payload = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.send_bytes(payload)
+        copied.value += 2 * len(payload)
+    conn.send_bytes(b'')
+    conn.close()
+
+
+def produce_ring(spec, count, done, copied):
+    ring = SharedFrameRing.attach(**spec)
+    source = np.random.default_rng(0).integers(0, 256, spec['shape'], dtype=np.uint8)
+    for i in range(count):
+        slot = ring.write_slot()
+        # Stands in for cv2.VideoCapture.read(slot), the only write of each frame
+        np.copyto(slot, source)
+        slot[0, 0, 0] = i % 256
+        ring.commit()
+        copied.value += slot.nbytes
+    done.set()
+    ring.close()
+
+
+def run_queue(shape, count):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    copied = multiprocessing.Value('q', 0, lock=False)
+    producer = multiprocessing.Process(target=produce_queue, args=(sender, shape, count, copied))
+    start = time.perf_counter()
+    producer.start()
+    sender.close()
+    received = checksum = consumer_copied = 0
+    # What Queue.get does: read the message out of the pipe, then unpickle it into a new array
+    while payload := receiver.recv_bytes():
+        frame = pickle.loads(payload)
+        consumer_copied += len(payload) + frame.nbytes
+        checksum += touch(frame)
+        received += 1
+    elapsed = time.perf_counter() - start
+    producer.join()
+    return received, 0, copied.value + consumer_copied, elapsed
+
+
+def run_ring(shape, count, slots=4):
+    ring = SharedFrameRing(shape, slots=slots)
+    done = multiprocessing.Event()
+    copied = multiprocessing.Value('q', 0, lock=False)
+    producer = multiprocessing.Process(target=produce_ring, args=(ring.spec, count, done, copied))
+    start = time.perf_counter()
+    producer.start()
+    seq = received = torn = checksum = 0
+    # Latest-frame semantics: the consumer reads the newest slot in place and may skip frames
+    while True:
+        new_seq, frame = ring.latest(after=seq)
+        if new_seq is None:
+            if done.is_set() and ring.latest(after=seq)[0] is None:
+                break
+            continue
+        seq = new_seq
+        value = touch(frame)
+        if not ring.still_valid(seq):
+            # The producer lapped the ring while the frame was being read
+            torn += 1
+            continue
+        checksum += value
+        received += 1
+    elapsed = time.perf_counter() - start
+    producer.join()
+    ring.close()
+    return received, torn, copied.value, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare frame transport between processes')
+    parser.add_argument('--frames', type=int, default=300, help='frames produced')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args()
+
+    shape = (args.height, args.width, 3)
+    frame_bytes = int(np.prod(shape))
+
+    print(f"{args.frames} frames of {args.width}x{args.height} ({frame_bytes / 1e6:.2f} MB each)")
+    print(f"{'transport':<12}{'copies/frame':>14}{'MB moved/frame':>16}{'frames read':>13}{'torn':>6}"
+          f"{'producer fps':>14}")
+    for name, run in [('queue', run_queue), ('ring', run_ring)]:
+        received, torn, copied, elapsed = run(shape, args.frames)
+        # Frames the consumer skipped were still copied by the producer, so divide by frames produced
+        per_frame = copied / args.frames
+        print(f"{name:<12}{per_frame / frame_bytes:>14.2f}{per_frame / 1e6:>16.2f}{received:>13}{torn:>6}"
+              f"{args.frames / elapsed:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
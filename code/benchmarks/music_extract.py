@@ -0,0 +1,101 @@
+# Compares reading video IDs from a results page the old way (download and
+# decode the whole page, regex over the text) with the streaming extractor the
+# music provider uses, against a saved page served from a local HTTP server.
+# Reports time, bytes read and the IDs found, and checks both agree. The
+# extractor's edge cases are covered by code/tests/test_music_extract.py.
+# Uses the saved page in code/tests/fixtures/youtube unless another one is given, e.g.:
+#   curl -o results.html "https://www.youtube.com/results?search_query=happy+background+tunes"
+# Usage: python code/benchmarks/music_extract.py results.html --limit 5 --runs 20
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine.music import VIDEO_ID_PATTERN, create_session, extract_video_ids
+
+FIXTURE_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures', 'youtube',
+                            'results.html')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # The streaming client hangs up as soon as it has enough IDs
+        pass
+
+
+def full_page(session, url, limit):
+    response = session.get(url)
+    text = response.text
+    ids = list(dict.fromkeys(m.decode('ascii') for m in VIDEO_ID_PATTERN.findall(text.encode())))[:limit]
+    # What the interfaces used to run over the decoded page
+    re.findall(r'/watch\?v=([^"]{11})', text)
+    return ids, len(response.content)
+
+
+def streamed(session, url, limit, chunk_size):
+    read = 0
+
+    def counted(chunks):
+        nonlocal read
+        for chunk in chunks:
+            read += len(chunk)
+            yield chunk
+
+    with session.get(url, stream=True) as response:
+        ids = extract_video_ids(counted(response.iter_content(chunk_size)), limit)
+    return ids, read
+
+
+def measure(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn()
+    return (time.perf_counter() - start) * 1000.0 / runs, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the streaming video ID extractor')
+    parser.add_argument('page', nargs='?', default=FIXTURE_PAGE,
+                        help='saved search results page (default: the test fixture page)')
+    parser.add_argument('--limit', type=int, default=5, help='video IDs to find')
+    parser.add_argument('--runs', type=int, default=20, help='requests per method')
+    parser.add_argument('--chunk-size', type=int, default=16384, help='streaming chunk size in bytes')
+    args = parser.parse_args()
+
+    directory, name = os.path.split(os.path.abspath(args.page))
+    server = QuietServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+
+    session = create_session()
+    try:
+        full_ms, (full_ids, full_bytes) = measure(lambda: full_page(session, url, args.limit), args.runs)
+        stream_ms, (stream_ids, stream_bytes) = measure(
+            lambda: streamed(session, url, args.limit, args.chunk_size), args.runs)
+    except requests.RequestException as e:
+        raise SystemExit(f"Request to the local server failed: {e}")
+    finally:
+        server.shutdown()
+
+    print(f"{'method':<12}{'ms/lookup':>11}{'bytes read':>13}  video IDs")
+    print(f"{'full page':<12}{full_ms:>11.2f}{full_bytes:>13}  {' '.join(full_ids)}")
+    print(f"{'streamed':<12}{stream_ms:>11.2f}{stream_bytes:>13}  {' '.join(stream_ids)}")
+    if stream_ids != full_ids:
+        raise SystemExit("The streaming extractor found different videos than the full page scan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+# Stage-by-stage benchmark of the whole per-frame pipeline on CPU:
+#   decode     - JPEG bytes to a BGR frame (what a network camera or the WebRTC path delivers)
+#   gray       - BGR to grayscale
+#   detect     - face detection
+#   preprocess - crop, resize and normalize the faces
+#   predict    - the emotion model's forward pass
+#   overlay    - drawing boxes and labels
+#   encode     - BGR frame back to JPEG (what the GUIs and streams send out)
+# Frames are synthetic (seeded noise with --face-image pasted in N times, so the
+# detector has real faces to find) or the first --frames frames of a recorded video.
+# Also reports model load time and peak memory, and writes everything as JSON so
+# runs from different commits can be compared with --baseline.
+# Usage: python code/benchmarks/pipeline.py --face-image face.jpg --faces 1 4 8 --output results.json
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+# Run on the CPU so the numbers match the machines the apps are deployed on
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1')
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import FacialEmotionEngine, draw_predictions
+from engine.inference import _to_predictions
+
+STAGES = ['decode', 'gray', 'detect', 'preprocess', 'predict', 'overlay', 'encode']
+FRAME_SIZE = (640, 480)
+
+
+def synthetic_frames(faces, count, face_image=None, seed=0):
+    """Return `count` JPEG-encoded frames with `faces` faces each, and the pasted face boxes."""
+    rng = np.random.default_rng(seed)
+    width, height = FRAME_SIZE
+    columns = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / columns))
+    size = min(width // columns, height // rows) - 10
+    boxes = [(5 + (i % columns) * (width // columns), 5 + (i // columns) * (height // rows), size, size)
+             for i in range(faces)]
+    face = cv2.resize(face_image, (size, size)) if face_image is not None else None
+    frames = []
+    for _ in range(count):
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        if face is not None:
+            for x, y, w, h in boxes:
+                frame[y:y + h, x:x + w] = face
+        frames.append(cv2.imencode('.jpg', frame)[1])
+    return frames, boxes
+
+
+def recorded_frames(path, count):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(cv2.imencode('.jpg', frame)[1])
+    capture.release()
+    if not frames:
+        raise SystemExit(f"Cannot read frames from {path}")
+    return frames
+
+
+def run_pipeline(engine, frames, boxes=None, warmup=5):
+    """Run every frame through all stages and return the per-stage timings in ms.
+
+    With `boxes`, frames where the detector finds fewer faces are classified with
+    these boxes instead, so the later stages always see the intended face count.
+    """
+    timings = {stage: [] for stage in STAGES + ['total']}
+    detected = []
+    for i in range(warmup + len(frames)):
+        data = frames[i % len(frames)]
+        marks = [time.perf_counter()]
+        frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        marks.append(time.perf_counter())
+        gray = engine.to_gray(frame)
+        marks.append(time.perf_counter())
+        faces = engine.detect_faces(gray)
+        marks.append(time.perf_counter())
+        found = len(faces)
+        if boxes is not None and found < len(boxes):
+            faces = boxes
+        rois = engine.preprocess_batch(gray, faces)
+        marks.append(time.perf_counter())
+        probs = engine.classify(rois)
+        marks.append(time.perf_counter())
+        draw_predictions(frame, _to_predictions(faces, probs))
+        marks.append(time.perf_counter())
+        cv2.imencode('.jpg', frame)
+        marks.append(time.perf_counter())
+        if i < warmup:
+            continue
+        detected.append(found)
+        for stage, start, end in zip(STAGES, marks, marks[1:]):
+            timings[stage].append((end - start) * 1000.0)
+        timings['total'].append((marks[-1] - marks[0]) * 1000.0)
+    return timings, detected
+
+
+def summarize(timings):
+    summary = {}
+    for stage, values in timings.items():
+        values = np.array(values)
+        summary[stage] = {
+            'mean_ms': float(values.mean()),
+            'p50_ms': float(np.percentile(values, 50)),
+            'p95_ms': float(np.percentile(values, 95)),
+            'max_ms': float(values.max()),
+        }
+    return summary
+
+
+def environment():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def compare(results, baseline):
+    """Print the mean latency change of every stage against a previous results file."""
+    print(f"\nAgainst baseline {baseline['environment'].get('commit')}:")
+    for name, run in results['runs'].items():
+        old = baseline['runs'].get(name)
+        if old is None:
+            continue
+        changes = []
+        for stage in STAGES + ['total']:
+            before, after = old['stages'][stage]['mean_ms'], run['stages'][stage]['mean_ms']
+            changes.append(f"{stage} {(after - before) / before * 100 if before else 0.0:+.0f}%")
+        print(f"  {name:<10}" + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every stage of the emotion pipeline')
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 4, 8], help='faces per synthetic frame')
+    parser.add_argument('--face-image', help='face crop pasted into the synthetic frames')
+    parser.add_argument('--video', help='benchmark on the frames of this recording as well')
+    parser.add_argument('--frames', type=int, default=200, help='timed frames per run')
+    parser.add_argument('--backend', default=None, help='keras, onnx or tflite (defaults to EMOTION_BACKEND)')
+    parser.add_argument('--detector', default=None, help='haar, yunet or res10 (defaults to EMOTION_DETECTOR)')
+    parser.add_argument('--threads', type=int, default=None, help='OpenCV threads (fixed for comparable runs)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    face_image = None
+    if args.face_image:
+        face_image = cv2.imread(args.face_image, cv2.IMREAD_COLOR)
+        if face_image is None:
+            raise SystemExit(f"Cannot read {args.face_image}")
+
+    start = time.perf_counter()
+    engine = FacialEmotionEngine(args.backend, detector=args.detector)
+    load_s = time.perf_counter() - start
+    results = {
+        'environment': environment(),
+        'backend': engine.backend.name,
+        'detector': engine.detector,
+        'frame_size': list(FRAME_SIZE),
+        'model_load_s': load_s,
+        'runs': {},
+    }
+
+    runs = [(f'{faces}_faces', *synthetic_frames(faces, args.frames, face_image)) for faces in args.faces]
+    if args.video:
+        runs.append(('recorded', recorded_frames(args.video, args.frames), None))
+
+    tracemalloc.start()
+    for name, frames, boxes in runs:
+        tracemalloc.reset_peak()
+        timings, detected = run_pipeline(engine, frames, boxes)
+        stages = summarize(timings)
+        results['runs'][name] = {
+            'frames': len(timings['total']),
+            'faces_detected_mean': float(np.mean(detected)),
+            'fps': 1000.0 / stages['total']['mean_ms'],
+            'python_peak_mb': tracemalloc.get_traced_memory()[1] / (1024 * 1024),
+            'stages': stages,
+        }
+    tracemalloc.stop()
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    print(f"{results['backend']} backend, {results['detector']} detector, model load {load_s:.2f}s, "
+          f"peak RSS {results['peak_rss_mb']:.0f} MB")
+    print(f"{'run':<12}" + ''.join(f"{stage:>11}" for stage in STAGES) + f"{'total':>10}{'fps':>8}")
+    for name, run in results['runs'].items():
+        print(f"{name:<12}" + ''.join(f"{run['stages'][stage]['mean_ms']:>9.2f}ms" for stage in STAGES)
+              + f"{run['stages']['total']['mean_ms']:>8.2f}ms{run['fps']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Compares per-frame classification latency of keras model.predict against the
+# traced graph used by FacialEmotionEngine.classify.
+# Usage: python code/benchmarks/predict_latency.py --faces 1 --runs 200
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+# Run on the CPU so the numbers match the machines the apps are deployed on
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1')
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import INPUT_SIZE, FacialEmotionEngine, KerasBackend
+
+
+def measure(fn, rois, runs, warmup=10):
+    """Call fn(rois) repeatedly and return the per-call latencies in milliseconds."""
+    for _ in range(warmup):
+        fn(rois)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(rois)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return np.array(timings)
+
+
+def report(name, timings):
+    print(f"{name:<28} mean {timings.mean():8.3f} ms   p50 {np.percentile(timings, 50):8.3f} ms   "
+          f"p95 {np.percentile(timings, 95):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare model.predict with the traced inference graph')
+    parser.add_argument('--faces', type=int, default=1, help='number of faces classified per frame')
+    parser.add_argument('--runs', type=int, default=200, help='number of timed frames')
+    args = parser.parse_args()
+
+    backend = KerasBackend()
+    engine = FacialEmotionEngine(backend=backend)
+    rng = np.random.default_rng(0)
+    rois = rng.random((args.faces, INPUT_SIZE[1], INPUT_SIZE[0], 1), dtype=np.float32)
+
+    # Both paths must agree before their speed is worth comparing
+    expected = backend.model.predict(rois, verbose=0)
+    np.testing.assert_allclose(engine.classify(rois), expected, atol=1e-5)
+
+    print(f"Per-frame latency on CPU, {args.faces} face(s) per frame, {args.runs} frames")
+    before = measure(lambda x: backend.model.predict(x, verbose=0), rois, args.runs)
+    after = measure(engine.classify, rois, args.runs)
+    report('model.predict (before)', before)
+    report('traced graph (after)', after)
+    print(f"Speedup: {before.mean() / after.mean():.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Measures how long it takes before the first emotion prediction is available:
+#   cold - a fresh Python process imports the engine, loads the model and classifies one frame
+#   warm - the same process asks for the engine again (what a Streamlit rerun or new session does)
+# Usage: python code/benchmarks/startup_time.py --runs 3 --backend keras
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Runs in a fresh interpreter so nothing is cached from a previous measurement
+CHILD = '''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.append({engine_dir!r})
+import numpy as np
+from engine import get_engine
+imported = time.perf_counter()
+engine = get_engine({backend!r})
+loaded = time.perf_counter()
+engine.predict_frame(np.zeros((480, 640, 3), dtype=np.uint8))
+first = time.perf_counter()
+get_engine({backend!r}).predict_frame(np.zeros((480, 640, 3), dtype=np.uint8))
+warm = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - start,
+    'load_s': loaded - imported,
+    'first_frame_s': first - loaded,
+    'cold_total_s': first - start,
+    'warm_s': warm - first,
+}}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold and warm engine start-up time')
+    parser.add_argument('--runs', type=int, default=3, help='number of fresh processes to start')
+    parser.add_argument('--backend', default=None, help='keras, onnx or tflite (defaults to EMOTION_BACKEND)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='2', CUDA_VISIBLE_DEVICES='-1')
+    code = CHILD.format(engine_dir=ENGINE_DIR, backend=args.backend)
+    results = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        # Includes interpreter start-up, which a container cold start also pays
+        result['process_s'] = time.perf_counter() - start
+        results.append(result)
+
+    print(f"{'run':<5}{'process':>10}{'import':>10}{'load':>10}{'1st frame':>11}{'cold':>10}{'warm':>12}")
+    for i, r in enumerate(results, 1):
+        print(f"{i:<5}{r['process_s']:>9.2f}s{r['import_s']:>9.2f}s{r['load_s']:>9.2f}s"
+              f"{r['first_frame_s']:>10.2f}s{r['cold_total_s']:>9.2f}s{r['warm_s'] * 1000:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,21 @@
-from streamlit_webrtc import webrtc_streamer, VideoTransformerBase
+from streamlit_webrtc import webrtc_streamer
 import streamlit as st
-import cv2
-from keras.models import load_model
-import numpy as np
 import webbrowser
 import requests
-import re
 import os
-import time
+import sys
 
-# Load model and labels
-model = load_model("code/model/fer2013_mini_XCEPTION.102-0.66.hdf5")
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import MoodLookup, enable_metrics, get_music_lookup
+from engine.webrtc import EmotionVideoProcessor, follow_mood
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Songs for every emotion are looked up once per process in the background and cached
+MUSIC_QUERY = '{emotion} background tunes'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
 
 # App config
 st.set_page_config(page_title="Emotion-Based Music Player", layout="centered")
@@ -54,32 +57,9 @@ if "last_emotion" not in st.session_state:
     st.session_state.last_emotion = "Neutral"
 if "show_video" not in st.session_state:
     st.session_state.show_video = False
-
-# Streamlit WebRTC Video Transformer
-class EmotionDetector(VideoTransformerBase):
-    def __init__(self):
-        self.last_emotion = "Neutral"
-
-    def transform(self, frame):
-        img = frame.to_ndarray(format="bgr24")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
-        for (x, y, w, h) in faces:
-            roi_gray = gray[y:y+h, x:x+w]
-            roi_gray = cv2.resize(roi_gray, (64, 64))
-            roi = roi_gray.astype("float") / 255.0
-            roi = np.expand_dims(roi, axis=0)
-            roi = np.expand_dims(roi, axis=-1)
-            preds = model.predict(roi)[0]
-            self.last_emotion = emotions[np.argmax(preds)]
-            st.session_state.last_emotion = self.last_emotion
-
-            cv2.rectangle(img, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(img, self.last_emotion, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
-            break
-
-        return img
+if "song_lookup" not in st.session_state:
+    # Song lookups run in the background, a newer mood cancels the lookup for the previous one
+    st.session_state.song_lookup = MoodLookup(music, MUSIC_QUERY, timeout=10.0)
 
 # 🎥 Live Camera Detection Mode
 if not st.session_state.show_video:
@@ -96,17 +76,21 @@ if not st.session_state.show_video:
 
         ctx = webrtc_streamer(
             key="emotion",
-            video_transformer_factory=EmotionDetector,
+            video_processor_factory=lambda: EmotionVideoProcessor(MUSIC_QUERY),
             rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
             )
 
 
     if capture:
-        if ctx.video_transformer:
-            st.session_state.last_emotion = ctx.video_transformer.last_emotion
+        if ctx.video_processor:
+            st.session_state.last_emotion = ctx.video_processor.last_emotion
             st.session_state.show_video = True
             st.rerun()
 
+    # Show the mood published by the inference worker while the camera runs and start its song lookup
+    if ctx.state.playing:
+        follow_mood(ctx, st.session_state.song_lookup, st.empty())
+
 # 🎧 Play Song For Detected Mood
 if st.session_state.show_video:
     st.markdown("## 🎧 Now Playing Music For Your Mood")
@@ -116,16 +100,15 @@ if st.session_state.show_video:
         st.session_state.show_video = False
         st.rerun()
 
-    search_query = f"https://www.youtube.com/results?search_query={st.session_state.last_emotion}+background+tunes"
-    response = requests.get(search_query)
-
-    if response.status_code != 200:
-        print("Failed to retrieve YouTube search results. Status code:", response.status_code)
-
-    html_content = response.text
-    match = re.search(r'/watch\?v=([^\"]+)', html_content)
-    if match:
-        video_id = match.group(1)
-        video_url = f"https://www.youtube.com/watch?v={video_id.encode('utf-8').decode('unicode_escape')}"
-        st.video(video_url)
-        print("Opening YouTube video:", video_url)
+    try:
+        # Reruns read the cached lookup instead of downloading the results page again
+        with st.spinner("Finding a song for your mood..."):
+            tracks = st.session_state.song_lookup.request(st.session_state.last_emotion).result()
+        track = tracks[0] if tracks else None
+    except (requests.RequestException, TimeoutError) as e:
+        track = None
+        print("Failed to retrieve YouTube search results:", e)
+
+    if track:
+        st.video(track.url)
+        print("Opening YouTube video:", track.url)
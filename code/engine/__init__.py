@@ -0,0 +1,38 @@
+# Shared building blocks for the facial emotion interfaces
+from .backends import BACKENDS, KerasBackend, OnnxBackend, TFLiteBackend, load_backend
+from .catalog import CatalogTrack, MusicCatalog, get_catalog, mood_point
+from .config import CASCADE_PATH, EMOTIONS, INPUT_SIZE, MODEL_PATH
+from .detectors import (
+    DETECTORS,
+    HaarFaceDetector,
+    Res10FaceDetector,
+    YuNetFaceDetector,
+    create_detector,
+)
+from .diskcache import SQLiteCache
+from .inference import (
+    FacePrediction,
+    FacialEmotionEngine,
+    draw_predictions,
+    get_engine,
+    primary_prediction,
+)
+from .metrics import NullMetrics, PrometheusMetrics, enable_metrics, get_metrics, set_metrics
+from .music import (
+    MoodLookup,
+    MusicLookup,
+    SpeculativePrefetcher,
+    Track,
+    TTLCache,
+    YouTubeSearchProvider,
+    get_music_lookup,
+    get_prefetcher,
+)
+from .offline import FrameAnnotation, MediaFrame, annotate_media, iter_media
+from .profiling import TraceRecorder
+from .ringbuffer import SharedFrameRing, capture_into_ring
+from .scheduler import AdaptiveScheduler
+from .smoothing import EmotionSmoother, MoodChange
+from .streams import BatchingInferenceWorker, MultiStreamServer, StreamProcessor, StreamResult
+from .tiling import TiledFaceDetector, merge_boxes, tile_grid
+from .tracking import FaceTracker, box_iou
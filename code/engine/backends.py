@@ -0,0 +1,151 @@
+# Interchangeable runtimes for the emotion classifier.
+# Every backend takes preprocessed ROIs of shape (N, 64, 64, 1) float32 and
+# returns the (N, 7) softmax probabilities, so the engine does not care which
+# one it is running on. The ONNX and TFLite files are produced offline by
+# code/tools/convert_model.py.
+import os
+import threading
+
+import numpy as np
+
+from .config import INPUT_SHAPE, MODEL_PATH
+
+
+def tflite_model_paths(model_path=MODEL_PATH):
+    """Float, dynamic-range and int8 TFLite files exported next to an hdf5 model.
+
+    The quantized variants are written by code/tools/quantize_model.py.
+    """
+    base = os.path.splitext(model_path)[0]
+    return base + '.tflite', base + '_dynamic.tflite', base + '_int8.tflite'
+
+
+ONNX_MODEL_PATH = os.path.splitext(MODEL_PATH)[0] + '.onnx'
+TFLITE_MODEL_PATH = tflite_model_paths()[0]
+
+# Backend and model file used when none is requested explicitly, can be overridden per process
+DEFAULT_BACKEND = os.environ.get('EMOTION_BACKEND', 'keras')
+DEFAULT_MODEL_PATH = os.environ.get('EMOTION_MODEL_PATH') or None
+
+
+class KerasBackend:
+    """Runs the original hdf5 model with TensorFlow."""
+
+    name = 'keras'
+
+    def __init__(self, model_path=MODEL_PATH):
+        import tensorflow as tf
+        from keras.models import load_model
+
+        self.model = load_model(model_path, compile=False)
+
+        # model.predict builds a tf.data pipeline and callbacks on every call, which costs far
+        # more than the network itself for a handful of 64x64 faces. Call the model directly
+        # inside a graph traced once for any batch size instead.
+        self._infer = tf.function(
+            lambda rois: self.model(rois, training=False),
+            input_signature=[tf.TensorSpec(shape=(None,) + INPUT_SHAPE, dtype=tf.float32)],
+        )
+        # Trace the graph now so the first frame does not pay for it
+        self._infer(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+
+    def __call__(self, rois):
+        return self._infer(rois).numpy()
+
+
+class OnnxBackend:
+    """Runs the exported ONNX model with onnxruntime on the CPU."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path=ONNX_MODEL_PATH):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime") from e
+
+        self.session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, rois):
+        return self.session.run(None, {self._input_name: rois})[0]
+
+
+class TFLiteBackend:
+    """Runs an exported TFLite model with the TFLite interpreter.
+
+    Works with the float model as well as the quantized ones, including
+    full-integer models whose input and output tensors are int8.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path=TFLITE_MODEL_PATH, num_threads=None):
+        # The standalone tflite-runtime wheel is much smaller than TensorFlow, prefer it
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite.python.interpreter import Interpreter
+            except ImportError as e:
+                raise ImportError("The tflite backend needs tflite-runtime: pip install tflite-runtime") from e
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter's tensors are shared state, calls from several threads take turns
+        self._lock = threading.Lock()
+
+    def __call__(self, rois):
+        inputs = _quantize(rois, self._input)
+        with self._lock:
+            # The interpreter has a static shape, only reallocate when the number of faces changes
+            if len(rois) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], rois.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(rois)
+            self.interpreter.set_tensor(self._input['index'], inputs)
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self._output['index'])
+        return _dequantize(outputs, self._output)
+
+
+def _quantize(values, details):
+    """Convert float values to the integer input type of a quantized tensor."""
+    dtype = details['dtype']
+    if dtype == np.float32:
+        return values
+    scale, zero_point = details['quantization']
+    info = np.iinfo(dtype)
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(values, details):
+    """Convert the integer output of a quantized tensor back to float32."""
+    if values.dtype == np.float32:
+        return values
+    scale, zero_point = details['quantization']
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    OnnxBackend.name: OnnxBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+
+def load_backend(name=None, model_path=None):
+    """Create the backend called `name` ('keras', 'onnx' or 'tflite').
+
+    `model_path` defaults to EMOTION_MODEL_PATH for the default backend, otherwise
+    to the file that backend expects next to the hdf5 model.
+    """
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    backend_cls = BACKENDS[name]
+    if model_path is None and name == DEFAULT_BACKEND:
+        model_path = DEFAULT_MODEL_PATH
+    return backend_cls() if model_path is None else backend_cls(model_path)
@@ -0,0 +1,206 @@
+# Offline music catalog. Tracks with audio features (valence, energy and
+# optionally tempo, as in Spotify-style exports) are stored column by column
+# in numpy arrays, sorted into a grid over the valence-arousal plane. The
+# model's 7-way softmax is mapped to a point on that plane and the nearest
+# tracks are found by searching only the grid cells around it, which keeps
+# top-k queries well under a millisecond for a million tracks.
+import csv
+import json
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from .config import EMOTIONS
+
+CatalogTrack = namedtuple('CatalogTrack', ['track_id', 'title', 'artist', 'url', 'valence', 'arousal', 'distance'])
+
+# Where each emotion sits on the valence-arousal plane (both in [0, 1], like
+# Spotify's valence and energy), after Russell's circumplex model of affect
+EMOTION_POINTS = {
+    'Angry': (0.15, 0.85),
+    'Disgust': (0.20, 0.60),
+    'Fear': (0.20, 0.80),
+    'Happy': (0.90, 0.70),
+    'Sad': (0.15, 0.25),
+    'Surprise': (0.70, 0.85),
+    'Neutral': (0.50, 0.40),
+}
+_POINTS = np.array([EMOTION_POINTS[emotion] for emotion in EMOTIONS], dtype=np.float32)
+
+# Tempo range mapped onto [0, 1] when it contributes to arousal
+TEMPO_RANGE = (60.0, 180.0)
+TEMPO_WEIGHT = 0.3
+
+
+def mood_point(mood):
+    """Map an emotion label or a 7-way probability vector to a (valence, arousal) point."""
+    if isinstance(mood, str):
+        return _POINTS[EMOTIONS.index(mood)]
+    probs = np.asarray(mood, dtype=np.float32)
+    return probs @ _POINTS / max(float(probs.sum()), 1e-6)
+
+
+def arousal_from(energy, tempo=None):
+    """Arousal of tracks from their energy, blended with their tempo when known."""
+    energy = np.asarray(energy, dtype=np.float32)
+    if tempo is None:
+        return energy
+    tempo = np.asarray(tempo, dtype=np.float32)
+    low, high = TEMPO_RANGE
+    pace = np.clip((tempo - low) / (high - low), 0.0, 1.0)
+    # Tracks without a tempo (NaN) keep their energy as arousal
+    return np.where(np.isnan(tempo), energy, (1 - TEMPO_WEIGHT) * energy + TEMPO_WEIGHT * pace)
+
+
+def read_tracks(path):
+    """Read track rows from a CSV file or a JSON file (a list of objects or one object per line)."""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _column(rows, *names, default=''):
+    for name in names:
+        if rows and name in rows[0]:
+            return [row.get(name, default) for row in rows]
+    return [default] * len(rows)
+
+
+def _floats(values):
+    return np.array([float(v) if v not in ('', None) else np.nan for v in values], dtype=np.float32)
+
+
+class MusicCatalog:
+    """Columnar track index searchable by valence-arousal distance.
+
+    grid is the number of cells per axis; tracks are stored sorted by cell,
+    so the tracks of a row of cells are one contiguous slice.
+    """
+
+    def __init__(self, track_ids, titles, artists, urls, valence, arousal, grid=64):
+        valence = np.clip(np.asarray(valence, dtype=np.float32), 0.0, 1.0)
+        arousal = np.clip(np.asarray(arousal, dtype=np.float32), 0.0, 1.0)
+        self.grid = grid
+        cells = self._cell(valence) * grid + self._cell(arousal)
+        order = np.argsort(cells, kind='stable')
+        self.track_ids = np.asarray(track_ids, dtype=object)[order]
+        self.titles = np.asarray(titles, dtype=object)[order]
+        self.artists = np.asarray(artists, dtype=object)[order]
+        self.urls = np.asarray(urls, dtype=object)[order]
+        self.valence = valence[order]
+        self.arousal = arousal[order]
+        # offsets[c]:offsets[c + 1] are the tracks in cell c
+        self.offsets = np.searchsorted(cells[order], np.arange(grid * grid + 1))
+
+    @classmethod
+    def from_rows(cls, rows, grid=64):
+        """Build a catalog from dicts with valence, energy and optionally tempo, id, title, artist, url."""
+        valence = _floats(_column(rows, 'valence'))
+        energy = _floats(_column(rows, 'energy', 'arousal'))
+        tempo_values = _column(rows, 'tempo', default=None)
+        tempo = _floats(tempo_values) if any(v not in ('', None) for v in tempo_values) else None
+        keep = ~(np.isnan(valence) | np.isnan(energy))
+        arousal = arousal_from(energy, tempo)
+
+        def column(*names):
+            return np.asarray(_column(rows, *names), dtype=object)[keep]
+
+        ids = _column(rows, 'id', 'track_id', default=None)
+        if not rows or ids[0] is None:
+            ids = [str(i) for i in range(len(rows))]
+        return cls(np.asarray(ids, dtype=object)[keep], column('title', 'name', 'track_name'),
+                   column('artist', 'artists', 'artist_name'), column('url', 'uri'),
+                   valence[keep], arousal[keep], grid)
+
+    @classmethod
+    def from_file(cls, path, grid=64):
+        """Ingest a CSV/JSON track list, or load an index saved with save()."""
+        if path.lower().endswith('.npz'):
+            return cls.load(path)
+        return cls.from_rows(read_tracks(path), grid)
+
+    def save(self, path):
+        """Save the index as a compressed .npz file."""
+        np.savez_compressed(path, grid=self.grid, valence=self.valence, arousal=self.arousal,
+                            track_ids=self.track_ids.astype(str), titles=self.titles.astype(str),
+                            artists=self.artists.astype(str), urls=self.urls.astype(str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # Already sorted by cell, so building the index again keeps the order
+            return cls(data['track_ids'], data['titles'], data['artists'], data['urls'],
+                       data['valence'], data['arousal'], int(data['grid']))
+
+    def __len__(self):
+        return len(self.valence)
+
+    def recommend(self, mood, k=10):
+        """Return the k tracks closest to a mood (an emotion label or a 7-way softmax), nearest first."""
+        point = mood_point(mood)
+        indices, distances = self.nearest(float(point[0]), float(point[1]), k)
+        return [CatalogTrack(self.track_ids[i], self.titles[i], self.artists[i], self.urls[i],
+                             float(self.valence[i]), float(self.arousal[i]), float(d))
+                for i, d in zip(indices, distances)]
+
+    def nearest(self, valence, arousal, k=10):
+        """Indices and distances of the k tracks nearest to (valence, arousal), nearest first.
+
+        Searches a square block of cells around the point and grows it until
+        the k-th candidate is closer than anything outside the block can be.
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        grid = self.grid
+        cx, cy = int(self._cell(valence)), int(self._cell(arousal))
+        radius = -1
+        while True:
+            radius += 1
+            x0, x1 = max(cx - radius, 0), min(cx + radius, grid - 1)
+            y0, y1 = max(cy - radius, 0), min(cy + radius, grid - 1)
+            starts = self.offsets[np.arange(x0, x1 + 1) * grid + y0]
+            ends = self.offsets[np.arange(x0, x1 + 1) * grid + y1 + 1]
+            if int((ends - starts).sum()) < k:
+                continue
+            candidates = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+            dv = self.valence[candidates] - valence
+            da = self.arousal[candidates] - arousal
+            distances = dv * dv + da * da
+            best = np.argpartition(distances, k - 1)[:k] if len(candidates) > k else np.arange(len(candidates))
+            best = best[np.argsort(distances[best])]
+            # Nearest point of the plane outside the block (block edges on the grid border don't count)
+            margin = min(valence - x0 / grid if x0 > 0 else np.inf,
+                         (x1 + 1) / grid - valence if x1 < grid - 1 else np.inf,
+                         arousal - y0 / grid if y0 > 0 else np.inf,
+                         (y1 + 1) / grid - arousal if y1 < grid - 1 else np.inf)
+            if distances[best[-1]] <= margin * margin:
+                return candidates[best], np.sqrt(distances[best])
+
+    def _cell(self, values):
+        return np.clip((np.asarray(values) * self.grid).astype(np.int64), 0, self.grid - 1)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(path=None):
+    """Return the shared catalog loaded from `path`, or from MUSIC_CATALOG (a CSV, JSON or .npz index).
+
+    Returns None when no catalog is configured.
+    """
+    path = path or os.environ.get('MUSIC_CATALOG')
+    if not path:
+        return None
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = MusicCatalog.from_file(path)
+        return _catalogs[path]
@@ -0,0 +1,15 @@
+# Paths and constants shared by the engine modules
+import os
+
+import cv2
+
+# Labels in the order the mini_XCEPTION model outputs them
+EMOTIONS = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
+
+MODEL_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+MODEL_PATH = os.path.join(MODEL_DIR, 'fer2013_mini_XCEPTION.102-0.66.hdf5')
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+# Input size expected by the model
+INPUT_SIZE = (64, 64)
+INPUT_SHAPE = (INPUT_SIZE[1], INPUT_SIZE[0], 1)
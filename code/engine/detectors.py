@@ -0,0 +1,132 @@
+# Interchangeable face detectors. Every detector is a callable taking a
+# grayscale frame and returning a list of (x, y, w, h) boxes, so the engine,
+# the tracker and the stream workers can use any of them.
+#   haar   - OpenCV's frontal face Haar cascade (the original detector)
+#   yunet  - OpenCV's YuNet CNN (cv2.FaceDetectorYN), copes with tilted and profile faces
+#   res10  - the res10 300x300 SSD face detector run through cv2.dnn
+# The DNN model files are not part of OpenCV's wheel; download them into
+# code/model (see the README) or pass their paths explicitly.
+import os
+
+import cv2
+import numpy as np
+
+from .config import CASCADE_PATH, MODEL_DIR
+
+YUNET_MODEL_PATH = os.path.join(MODEL_DIR, 'face_detection_yunet_2023mar.onnx')
+RES10_CONFIG_PATH = os.path.join(MODEL_DIR, 'deploy.prototxt')
+RES10_MODEL_PATH = os.path.join(MODEL_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+
+# Detector used when none is requested explicitly, can be overridden per process
+DEFAULT_DETECTOR = os.environ.get('EMOTION_DETECTOR', 'haar')
+
+
+def _require(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Face detector model not found: {path} (see the README for where to get it)")
+    return path
+
+
+class HaarFaceDetector:
+    """The Haar cascade, not safe to call from several threads at once."""
+
+    name = 'haar'
+
+    def __init__(self, cascade_path=CASCADE_PATH, scale_factor=1.3, min_neighbors=5, min_size=(0, 0)):
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise ValueError(f"Failed to load Haar cascade classifier from {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+
+    def __call__(self, gray):
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=self.min_size)
+        return [tuple(int(v) for v in face) for face in faces]
+
+
+class _GrayToBGR:
+    """Reused 3-channel copy of gray frames for the DNN detectors, which expect BGR input."""
+
+    def __init__(self):
+        self._bgr = None
+
+    def __call__(self, gray):
+        if gray.ndim == 3:
+            return gray
+        if self._bgr is None or self._bgr.shape[:2] != gray.shape:
+            self._bgr = np.empty(gray.shape + (3,), dtype=np.uint8)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=self._bgr)
+
+
+class YuNetFaceDetector:
+    """OpenCV's YuNet face detector."""
+
+    name = 'yunet'
+
+    def __init__(self, model_path=YUNET_MODEL_PATH, score_threshold=0.8, nms_threshold=0.3, top_k=50):
+        self.detector = cv2.FaceDetectorYN.create(_require(model_path), '', (320, 320),
+                                                  score_threshold, nms_threshold, top_k)
+        self._input_size = None
+        self._to_bgr = _GrayToBGR()
+
+    def __call__(self, gray):
+        image = self._to_bgr(gray)
+        height, width = image.shape[:2]
+        if self._input_size != (width, height):
+            self.detector.setInputSize((width, height))
+            self._input_size = (width, height)
+        _, faces = self.detector.detect(image)
+        if faces is None:
+            return []
+        return _clip_boxes(faces[:, :4], width, height)
+
+
+class Res10FaceDetector:
+    """The res10 SSD face detector (Caffe model) run on OpenCV's CPU DNN backend."""
+
+    name = 'res10'
+
+    def __init__(self, config_path=RES10_CONFIG_PATH, model_path=RES10_MODEL_PATH, confidence=0.5):
+        self.net = cv2.dnn.readNetFromCaffe(_require(config_path), _require(model_path))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+        self._to_bgr = _GrayToBGR()
+
+    def __call__(self, gray):
+        image = self._to_bgr(gray)
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        corners = detections[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+        boxes = np.column_stack([corners[:, :2], corners[:, 2:] - corners[:, :2]])
+        return _clip_boxes(boxes, width, height)
+
+
+def _clip_boxes(boxes, width, height):
+    result = []
+    for x, y, w, h in boxes:
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+        if x1 - x0 > 1 and y1 - y0 > 1:
+            result.append((x0, y0, x1 - x0, y1 - y0))
+    return result
+
+
+DETECTORS = {
+    HaarFaceDetector.name: HaarFaceDetector,
+    YuNetFaceDetector.name: YuNetFaceDetector,
+    Res10FaceDetector.name: Res10FaceDetector,
+}
+
+
+def create_detector(name=None, **options):
+    """Create the face detector called `name` ('haar', 'yunet' or 'res10') with its options."""
+    name = (name or DEFAULT_DETECTOR).lower()
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector {name!r}, expected one of {', '.join(DETECTORS)}")
+    return DETECTORS[name](**options)
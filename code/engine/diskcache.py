@@ -0,0 +1,102 @@
+# Persistent key-value cache in a SQLite file, shared by every process on the
+# host that opens the same path (Streamlit replicas, CLI runs, restarts).
+# SQLite's write-ahead log lets readers and one writer work at the same time
+# and its file locks serialize writers across processes; each thread and
+# process uses its own connection. Keys and values are stored as JSON.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteCache:
+    """Disk cache whose entries expire `ttl` seconds after they were stored.
+
+    At most `max_entries` are kept; the least recently read ones are evicted first.
+    """
+
+    def __init__(self, path, ttl=3600.0, max_entries=10000, timeout=5.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        self._enable_wal(conn)
+        conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                     'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+
+    def _connection(self):
+        # Connections must not be shared between threads or inherited by forked processes
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    def _enable_wal(self, conn):
+        # The journal mode is stored in the file, but switching it ignores the busy
+        # timeout, so processes opening a new cache at the same time retry here
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if conn.execute('PRAGMA journal_mode=WAL').fetchone()[0] == 'wal':
+                    return
+            except sqlite3.OperationalError:
+                if time.monotonic() >= deadline:
+                    raise
+            time.sleep(0.05)
+
+    def get_with_ttl(self, key):
+        """Return (value, seconds until it expires) for a key, or None if missing or expired."""
+        key = json.dumps(key)
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires <= now:
+            conn.execute('DELETE FROM entries WHERE key = ? AND expires <= ?', (key, now))
+            return None
+        conn.execute('UPDATE entries SET used = ? WHERE key = ?', (now, key))
+        return json.loads(value), expires - now
+
+    def get(self, key):
+        entry = self.get_with_ttl(key)
+        return None if entry is None else entry[0]
+
+    def put(self, key, value):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO entries (key, value, expires, used) VALUES (?, ?, ?, ?)',
+                         (json.dumps(key), json.dumps(value), now + self.ttl, now))
+            conn.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+            conn.execute('DELETE FROM entries WHERE key IN '
+                         '(SELECT key FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def __contains__(self, key):
+        return self.get_with_ttl(key) is not None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM entries')
+
+    def close(self):
+        """Close the calling thread's connection."""
+        if getattr(self._local, 'pid', None) == os.getpid():
+            self._local.conn.close()
+        self._local.pid = None
@@ -0,0 +1,257 @@
+# Shared facial emotion inference engine used by every interface
+# (CLI, Streamlit, PySimpleGUI and the deployed app)
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from .backends import DEFAULT_BACKEND, load_backend
+from .config import CASCADE_PATH, EMOTIONS, INPUT_SHAPE, INPUT_SIZE
+from .detectors import DEFAULT_DETECTOR, create_detector
+from .metrics import FACES_PER_FRAME, FRAMES, PREDICTIONS, STAGE_SECONDS, get_metrics
+from .tiling import TiledFaceDetector
+from .tracking import FaceTracker
+
+# One classified face: box is (x, y, w, h), probs is the 7-way softmax vector and
+# face_id identifies the same face across frames when a FaceTracker is used
+FacePrediction = namedtuple('FacePrediction', ['box', 'label', 'probs', 'face_id'], defaults=[None])
+
+
+class FacialEmotionEngine:
+    """Owns the emotion model and the face detector.
+
+    All interfaces go through this class so the preprocessing (grayscale,
+    INTER_AREA resize to 64x64, float32 scaled to [0, 1]) is identical
+    everywhere and there is a single place to make inference faster.
+    """
+
+    def __init__(self, backend=None, model_path=None, cascade_path=CASCADE_PATH,
+                 scale_factor=1.3, min_neighbors=5, detector=None, detector_options=None):
+        # backend is a backend name (see engine.backends) or an already created backend
+        if backend is None or isinstance(backend, str):
+            backend = load_backend(backend, model_path)
+        self.backend = backend
+        self.cascade_path = cascade_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        # detector is a detector name (see engine.detectors), the Haar options above apply to 'haar'
+        self.detector = (detector or DEFAULT_DETECTOR).lower()
+        self.detector_options = detector_options or {}
+        # Per-thread preallocated buffers (see _buffers) and face detectors (see detect_faces)
+        self._local = threading.local()
+        # Created here so missing detector model files are reported when the engine is built
+        self._local.detect = self.create_face_detector()
+
+    def create_face_detector(self, tile_size=None, **tile_options):
+        """Return a new detect(gray) callable returning face boxes (x, y, w, h).
+
+        Neither cascades nor DNN nets may run from several threads at once,
+        so every thread that detects faces needs its own detector.
+        With tile_size=(w, h), frames larger than a tile are searched with the
+        Haar cascade in parallel tiles instead (see engine.tiling.TiledFaceDetector).
+        """
+        if tile_size is not None:
+            if self.detector != 'haar':
+                raise ValueError("Tiled detection is only available with the haar detector")
+            return TiledFaceDetector(self.cascade_path, self.scale_factor, self.min_neighbors,
+                                     tile_size=tile_size, **tile_options)
+        if self.detector == 'haar':
+            options = dict(cascade_path=self.cascade_path, scale_factor=self.scale_factor,
+                           min_neighbors=self.min_neighbors)
+            options.update(self.detector_options)
+            return create_detector('haar', **options)
+        return create_detector(self.detector, **self.detector_options)
+
+    def detect_faces(self, gray):
+        """Return the face boxes (x, y, w, h) in a grayscale image.
+
+        The shared engine is called from many threads (Streamlit sessions,
+        scheduler workers), so each thread runs its own detector.
+        """
+        local = self._local
+        detect = getattr(local, 'detect', None)
+        if detect is None:
+            detect = local.detect = self.create_face_detector()
+        return detect(gray)
+
+    def preprocess(self, gray, box):
+        """Crop one face out of a grayscale image and turn it into a new model input array."""
+        return self.preprocess_batch(gray, [box])[0].copy()
+
+    def preprocess_batch(self, gray, boxes, offset=0):
+        """Crop faces into the reused (N, 64, 64, 1) float32 input buffer of the calling thread.
+
+        Each face is resized straight into a preallocated uint8 slot and the
+        whole batch is then scaled to [0, 1] by one vectorized divide into the
+        float32 buffer, so nothing is allocated per face. Faces are written
+        from index `offset` on (to gather several frames into one batch) and
+        the returned view covers [0, offset + len(boxes)). It is overwritten
+        by the next call from the same thread; copy it to keep it longer.
+        """
+        end = offset + len(boxes)
+        pixels, rois = self._buffers(end)
+        for i, (x, y, w, h) in enumerate(boxes, offset):
+            cv2.resize(gray[y:y + h, x:x + w], INPUT_SIZE, dst=pixels[i], interpolation=cv2.INTER_AREA)
+        np.divide(pixels[offset:end], np.float32(255.0), out=rois[offset:end, ..., 0], dtype=np.float32)
+        return rois[:end]
+
+    def _buffers(self, size):
+        """Return this thread's (uint8 pixels, float32 rois) buffers, grown to hold `size` faces."""
+        local = self._local
+        capacity = len(local.rois) if hasattr(local, 'rois') else 0
+        if size > capacity or capacity == 0:
+            capacity = max(size, 2 * capacity, 8)
+            pixels = np.empty((capacity,) + INPUT_SIZE[::-1], dtype=np.uint8)
+            rois = np.empty((capacity,) + INPUT_SHAPE, dtype=np.float32)
+            if hasattr(local, 'rois'):
+                # Keep faces already gathered by an earlier call with an offset
+                pixels[:len(local.pixels)] = local.pixels
+                rois[:len(local.rois)] = local.rois
+            local.pixels, local.rois = pixels, rois
+        return local.pixels, local.rois
+
+    def to_gray(self, frame):
+        """Convert a BGR frame to grayscale into the calling thread's reused buffer."""
+        local = self._local
+        gray = getattr(local, 'gray', None)
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = local.gray = np.empty(frame.shape[:2], dtype=np.uint8)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+
+    def classify(self, rois):
+        """Run the model on preprocessed ROIs of shape (N, 64, 64, 1), returns (N, 7) probabilities.
+
+        All ROIs go through the model in a single forward pass.
+        """
+        if len(rois) == 0:
+            return np.zeros((0, len(EMOTIONS)), dtype=np.float32)
+        return np.asarray(self.backend(np.asarray(rois, dtype=np.float32)), dtype=np.float32)
+
+    def predict_faces(self, gray, faces, face_ids=None):
+        """Classify the given face boxes of a grayscale image."""
+        if len(faces) == 0:
+            return []
+        metrics = get_metrics()
+        with metrics.timer(STAGE_SECONDS, stage='preprocess'):
+            rois = self.preprocess_batch(gray, faces)
+        with metrics.timer(STAGE_SECONDS, stage='predict'):
+            probs = self.classify(rois)
+        predictions = _to_predictions(faces, probs, face_ids)
+        _count_predictions(metrics, predictions)
+        return predictions
+
+    def create_tracker(self, detect_interval=10, detect=None, **kwargs):
+        """Create a FaceTracker that runs the detector every `detect_interval` frames.
+
+        `detect` defaults to this engine's detect_faces, which uses a detector
+        of the thread that calls tracker.update.
+        """
+        return FaceTracker(detect or self.detect_faces, detect_interval=detect_interval, **kwargs)
+
+    def predict_frame(self, frame, tracker=None):
+        """Detect and classify every face in a BGR frame.
+
+        With a tracker (see create_tracker) faces are only detected every few
+        frames and followed in between, and predictions carry a face_id.
+        """
+        metrics = get_metrics()
+        metrics.increment(FRAMES)
+        with metrics.timer(STAGE_SECONDS, stage='gray'):
+            gray = self.to_gray(frame)
+        if tracker is None:
+            with metrics.timer(STAGE_SECONDS, stage='detect'):
+                faces = self.detect_faces(gray)
+            face_ids = None
+        else:
+            with metrics.timer(STAGE_SECONDS, stage='track'):
+                tracked = tracker.update(gray)
+            faces = [box for _, box in tracked]
+            face_ids = [face_id for face_id, _ in tracked]
+        metrics.observe(FACES_PER_FRAME, len(faces))
+        return self.predict_faces(gray, faces, face_ids)
+
+    def predict_batch(self, frames):
+        """Detect and classify faces in several BGR frames, returns one list per frame.
+
+        The faces of all frames are classified together in one forward pass.
+        """
+        metrics = get_metrics()
+        faces_per_frame = []
+        rois = None
+        count = 0
+        for frame in frames:
+            metrics.increment(FRAMES)
+            with metrics.timer(STAGE_SECONDS, stage='gray'):
+                gray = self.to_gray(frame)
+            with metrics.timer(STAGE_SECONDS, stage='detect'):
+                faces = self.detect_faces(gray)
+            metrics.observe(FACES_PER_FRAME, len(faces))
+            faces_per_frame.append(faces)
+            with metrics.timer(STAGE_SECONDS, stage='preprocess'):
+                rois = self.preprocess_batch(gray, faces, offset=count)
+            count += len(faces)
+
+        if count == 0:
+            return [[] for _ in frames]
+        with metrics.timer(STAGE_SECONDS, stage='predict'):
+            probs = self.classify(rois)
+
+        results = []
+        start = 0
+        for faces in faces_per_frame:
+            predictions = _to_predictions(faces, probs[start:start + len(faces)])
+            _count_predictions(metrics, predictions)
+            results.append(predictions)
+            start += len(faces)
+        return results
+
+
+# Process-wide engines, keyed by (backend, model_path, detector)
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(backend=None, model_path=None, detector=None):
+    """Return the shared engine for this backend and face detector, loading it on the first call.
+
+    Loading TensorFlow and the model takes seconds, so interfaces should call
+    this when they first need a prediction instead of creating their own
+    FacialEmotionEngine at import time. Streamlit reruns and sessions then
+    all reuse the engine that is already loaded in the process.
+    """
+    key = ((backend or DEFAULT_BACKEND).lower(), model_path, (detector or DEFAULT_DETECTOR).lower())
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = FacialEmotionEngine(key[0], model_path, detector=key[2])
+        return _engines[key]
+
+
+def _to_predictions(faces, probs, face_ids=None):
+    face_ids = face_ids if face_ids is not None else [None] * len(faces)
+    return [FacePrediction(tuple(box), EMOTIONS[int(np.argmax(p))], p, face_id)
+            for box, p, face_id in zip(faces, probs, face_ids)]
+
+
+def _count_predictions(metrics, predictions):
+    if metrics.enabled:
+        for prediction in predictions:
+            metrics.increment(PREDICTIONS, emotion=prediction.label)
+
+
+def primary_prediction(predictions):
+    """Return the prediction for the largest face, or None if there are no faces."""
+    if not predictions:
+        return None
+    return max(predictions, key=lambda prediction: prediction.box[2] * prediction.box[3])
+
+
+def draw_predictions(frame, predictions, color=(255, 0, 0), text_color=None):
+    """Draw a box and the emotion label for each prediction onto the frame (in place)."""
+    text_color = color if text_color is None else text_color
+    with get_metrics().timer(STAGE_SECONDS, stage='overlay'):
+        for prediction in predictions:
+            x, y, w, h = prediction.box
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+            cv2.putText(frame, prediction.label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, text_color, 2)
+    return frame
@@ -0,0 +1,218 @@
+# Hot-path metrics. The engine, the scheduler and the interfaces report through
+# get_metrics(), which is a no-op until an interface calls enable_metrics(), so
+# an uninstrumented run only pays for a few empty method calls per frame.
+# PrometheusMetrics keeps histograms and counters in memory and can serve them
+# in the Prometheus text format on a local port for scraping.
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metric names reported by the engine and the interfaces
+STAGE_SECONDS = 'emotion_stage_seconds'              # histogram, label stage
+FRAMES = 'emotion_frames_total'                      # counter
+DROPPED_FRAMES = 'emotion_frames_dropped_total'      # counter, label reason
+FACES_PER_FRAME = 'emotion_faces_per_frame'          # histogram
+PREDICTIONS = 'emotion_predictions_total'            # counter, label emotion
+SONG_WAIT_SECONDS = 'emotion_song_wait_seconds'      # histogram, label outcome
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FACE_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+
+HELP = {
+    STAGE_SECONDS: 'Time spent in each stage of the frame pipeline.',
+    FRAMES: 'Frames run through the emotion pipeline.',
+    DROPPED_FRAMES: 'Frames skipped without inference.',
+    FACES_PER_FRAME: 'Faces found per frame.',
+    PREDICTIONS: 'Faces classified, by predicted emotion.',
+    SONG_WAIT_SECONDS: 'Time from requesting a song for a mood to having one.',
+}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Metrics sink that records nothing, the default."""
+
+    enabled = False
+
+    def increment(self, name, amount=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class PrometheusMetrics:
+    """In-memory counters and histograms, rendered in the Prometheus text exposition format.
+
+    buckets maps histogram names to their upper bounds; histograms not listed
+    there use LATENCY_BUCKETS (seconds).
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=None):
+        self.buckets = {FACES_PER_FRAME: FACE_BUCKETS}
+        self.buckets.update(buckets or {})
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager observing the time spent inside it into histogram `name`."""
+        return _Timer(self, name, labels)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                describe(name, 'counter')
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                describe(name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """Serve the metrics at http://host:port/metrics from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+_metrics = NullMetrics()
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics sink (a NullMetrics unless metrics were enabled)."""
+    return _metrics
+
+
+def set_metrics(metrics):
+    """Replace the process-wide metrics sink, e.g. with an adapter to another metrics library."""
+    global _metrics
+    _metrics = metrics if metrics is not None else NullMetrics()
+    return _metrics
+
+
+def enable_metrics(port=None, host='127.0.0.1'):
+    """Start collecting metrics in this process, served on `port` if given.
+
+    Without arguments the port comes from EMOTION_METRICS_PORT, and metrics
+    stay disabled when that is not set either. Safe to call on every rerun.
+    """
+    if port is None:
+        port = os.environ.get('EMOTION_METRICS_PORT')
+        if not port:
+            return _metrics
+    with _metrics_lock:
+        if not isinstance(_metrics, PrometheusMetrics):
+            set_metrics(PrometheusMetrics())
+        _metrics.serve(int(port), host)
+    return _metrics
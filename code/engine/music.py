@@ -0,0 +1,485 @@
+# Music lookup for a detected emotion. A provider turns a search query into
+# tracks (YouTubeSearchProvider scrapes the YouTube results page over a pooled
+# HTTP session); MusicLookup caches the tracks per (emotion, query template)
+# and can fetch all emotions in the background at startup, so pressing play
+# usually reads from memory instead of waiting for a results page.
+#
+# Any object with a search(query, limit) method returning a list of Track can
+# be used as a provider, e.g. YouTubeSearchProvider pointed at a local server
+# that serves saved result pages.
+#
+# User interfaces should not wait on the network: lookup_async returns a
+# future, and MoodLookup keeps one request per UI where a newer mood cancels
+# the older request and the result is handed to a callback.
+# SpeculativePrefetcher watches the live emotion probabilities and fetches
+# the likeliest moods before anyone asks, so the first song is ready on capture.
+# Behind the in-memory cache, an optional SQLiteCache (engine.diskcache) keeps
+# results across restarts and shares them between processes on the host.
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import EMOTIONS
+from .diskcache import SQLiteCache
+from .metrics import SONG_WAIT_SECONDS, get_metrics
+
+logger = logging.getLogger(__name__)
+
+Track = namedtuple('Track', ['video_id', 'url', 'title'], defaults=[None])
+
+# Search endpoint, can point at a local stand-in server
+SEARCH_URL = os.environ.get('MUSIC_SEARCH_URL', 'https://www.youtube.com/results')
+DEFAULT_QUERY = '{emotion} background tunes'
+# Disk cache shared by all processes, set MUSIC_CACHE_PATH to an empty string to disable it
+CACHE_PATH = os.environ.get('MUSIC_CACHE_PATH', os.path.join(
+    os.path.expanduser('~'), '.cache', 'facial-emotion-music', 'tracks.sqlite'))
+
+# Watch links in the results page, also with '=' escaped as in the page's JSON. A video ID is
+# 11 base64url characters encoding 64 bits, so its last character carries only 4 bits.
+VIDEO_ID_PATTERN = re.compile(rb'/watch\?v(?:=|\\u003d)([A-Za-z0-9_-]{10}[AEIMQUYcgkosw048])(?![A-Za-z0-9_-])')
+# Longest match, kept between chunks so links split across two chunks are still found
+_MAX_MATCH = 32
+
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def extract_video_ids(chunks, limit=5):
+    """Return the first `limit` unique video IDs found in an iterable of byte chunks.
+
+    Stops reading as soon as enough IDs were found, so a caller streaming a
+    response only downloads the start of the page.
+    """
+    found = {}
+    tail = b''
+    for chunk in chunks:
+        buffer = tail + chunk
+        for match in VIDEO_ID_PATTERN.finditer(buffer):
+            # A match touching the end may continue in the next chunk, it is seen again there
+            if match.end() < len(buffer):
+                found.setdefault(match.group(1).decode('ascii'), None)
+                if len(found) >= limit:
+                    return list(found)
+        tail = buffer[-_MAX_MATCH:]
+    for match in VIDEO_ID_PATTERN.finditer(tail):
+        found.setdefault(match.group(1).decode('ascii'), None)
+    return list(found)[:limit]
+
+
+def create_session(pool_size=8, retries=1):
+    """Return a requests.Session that keeps up to `pool_size` connections per host alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # A desktop browser gets the same results page layout on every request
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+        'Accept-Language': 'en-US,en;q=0.9',
+    })
+    return session
+
+
+class YouTubeSearchProvider:
+    """Finds videos for a query on a YouTube results page.
+
+    The page is streamed and scanned as raw bytes, and the download stops
+    once `limit` videos were found instead of decoding the whole page.
+    """
+
+    name = 'youtube'
+
+    def __init__(self, search_url=SEARCH_URL, session=None, timeout=10, chunk_size=16384):
+        self.search_url = search_url
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+    def search(self, query, limit=5):
+        with self.session.get(self.search_url, params={'search_query': query}, timeout=self.timeout,
+                              stream=True) as response:
+            response.raise_for_status()
+            video_ids = extract_video_ids(response.iter_content(self.chunk_size), limit)
+        return [Track(video_id, watch_url(video_id)) for video_id in video_ids]
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire `ttl` seconds after they were stored."""
+
+    def __init__(self, max_entries=128, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class MusicLookup:
+    """Cached track lookup per emotion.
+
+    query is a template with an {emotion} field, e.g. '{emotion} weekend beats'.
+    Concurrent lookups of the same (emotion, query) share one request.
+    Empty results and failures are not cached, so they are retried next time.
+    store is an optional second-level cache with get_with_ttl/put, such as
+    an SQLiteCache; it is only read and written from the lookup threads.
+    """
+
+    def __init__(self, provider=None, query=DEFAULT_QUERY, limit=5, ttl=3600.0, max_entries=128, workers=4,
+                 store=None):
+        self.provider = provider or YouTubeSearchProvider()
+        self.query = query
+        self.limit = limit
+        self.cache = TTLCache(max_entries, ttl)
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='music-lookup')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def cached(self, emotion, query=None):
+        """Return True if the tracks for an emotion are cached or being fetched already."""
+        key = (emotion, query or self.query)
+        with self._lock:
+            if key in self._inflight:
+                return True
+        return key in self.cache
+
+    def tracks(self, emotion, query=None):
+        """Return the tracks for an emotion, from the cache when possible (blocks on a miss)."""
+        key = (emotion, query or self.query)
+        tracks = self.cache.get(key)
+        if tracks is not None:
+            return tracks
+        return self._fetch(key).result()
+
+    def lookup_async(self, emotion, query=None, timeout=None):
+        """Return a Future of the tracks for an emotion, without blocking.
+
+        The future fails with TimeoutError after `timeout` seconds. Cancelling
+        it only detaches the caller; the shared fetch still fills the cache.
+        """
+        key = (emotion, query or self.query)
+        result = Future()
+        tracks = self.cache.get(key)
+        if tracks is not None:
+            result.set_result(tracks)
+            return result
+        self._fetch(key).add_done_callback(lambda source: _forward(source, result))
+        if timeout is not None and not result.done():
+            timer = threading.Timer(timeout, _set_exception, (result, TimeoutError(
+                f"Music lookup for {emotion} took longer than {timeout:g}s")))
+            timer.daemon = True
+            timer.start()
+            result.add_done_callback(lambda _: timer.cancel())
+        return result
+
+    def first(self, emotion, query=None):
+        """Return the top track for an emotion, or None if nothing was found."""
+        tracks = self.tracks(emotion, query)
+        return tracks[0] if tracks else None
+
+    def prefetch(self, emotions=EMOTIONS, query=None):
+        """Start fetching the tracks of these emotions in the background, returns their futures."""
+        futures = []
+        for emotion in emotions:
+            key = (emotion, query or self.query)
+            if key not in self.cache:
+                future = self._fetch(key)
+                future.add_done_callback(_log_failure)
+                futures.append(future)
+        return futures
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._executor.submit(self._load, key)
+        return future
+
+    def _load(self, key):
+        emotion, query = key
+        try:
+            stored = self._read_store(key)
+            if stored is not None:
+                tracks, ttl = stored
+                self.cache.put(key, tracks, ttl)
+                return tracks
+            tracks = self.provider.search(query.format(emotion=emotion), self.limit)
+            if tracks:
+                self.cache.put(key, tracks)
+                self._write_store(key, tracks)
+            return tracks
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+    def _read_store(self, key):
+        if self.store is None:
+            return None
+        try:
+            entry = self.store.get_with_ttl(key)
+        except sqlite3.Error as e:
+            # The disk cache only saves requests, never let it fail a lookup
+            logger.warning("Music disk cache read failed: %s", e)
+            return None
+        if entry is None:
+            return None
+        tracks, ttl = entry
+        return [Track(*track) for track in tracks], ttl
+
+    def _write_store(self, key, tracks):
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, [list(track) for track in tracks])
+        except sqlite3.Error as e:
+            logger.warning("Music disk cache write failed: %s", e)
+
+
+class MoodLookup:
+    """The music lookup of one user interface, where a newer mood supersedes the previous one.
+
+    request(emotion) cancels the unfinished request for an older mood, and
+    callback(emotion, tracks, error) is called from a lookup thread when a
+    request that was not superseded finishes (tracks is None on failure).
+    UIs must hand the result to their own thread, e.g. with
+    window.write_event_value in PySimpleGUI.
+
+    After a failed lookup, requests for that mood return the failed future
+    until a retry delay has passed. The delay starts at `retry_delay` seconds
+    and doubles with every further failure up to `max_retry_delay`, so UIs that
+    poll request() do not hammer the search while offline or rate-limited.
+    """
+
+    def __init__(self, lookup=None, query=None, timeout=10.0, callback=None, retry_delay=2.0,
+                 max_retry_delay=60.0):
+        self.lookup = lookup or get_music_lookup()
+        self.query = query
+        self.timeout = timeout
+        self.callback = callback
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.emotion = None
+        self.future = None
+        # emotion -> (consecutive failures, monotonic time of the next attempt, failed future)
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def request(self, emotion):
+        """Start looking up tracks for `emotion` and return the future of the tracks.
+
+        Every call ends in one callback for its emotion, unless a newer mood supersedes it.
+        """
+        with self._lock:
+            failure = self._failures.get(emotion)
+            backing_off = failure is not None and time.monotonic() < failure[1]
+            # The same mood reuses its request unless that one failed
+            reuse = (self.future is not None and emotion == self.emotion
+                     and (backing_off or not _failed(self.future)))
+            if not reuse:
+                if self.future is not None:
+                    self.future.cancel()
+                self.emotion = emotion
+                if backing_off:
+                    # Report the recent failure again instead of querying the search
+                    self.future = failure[2]
+                else:
+                    self.future = self.lookup.lookup_async(emotion, self.query, self.timeout)
+            future = self.future
+        if reuse or backing_off:
+            # Runs right away when the future is already done
+            future.add_done_callback(lambda done: self._notify(emotion, done))
+            return future
+        start = time.monotonic()
+        future.add_done_callback(lambda done: self._finished(emotion, done, start))
+        return future
+
+    def cancel(self):
+        with self._lock:
+            if self.future is not None:
+                self.future.cancel()
+            self.future = self.emotion = None
+
+    def _finished(self, emotion, future, start):
+        if future.cancelled():
+            return
+        error = future.exception()
+        # Time from asking for a song to having one, 0 when it was already cached
+        get_metrics().observe(SONG_WAIT_SECONDS, time.monotonic() - start, outcome='error' if error else 'ok')
+        with self._lock:
+            if error is None:
+                self._failures.pop(emotion, None)
+            else:
+                failures = self._failures.get(emotion, (0, 0.0, None))[0] + 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+                self._failures[emotion] = (failures, time.monotonic() + delay, future)
+        self._notify(emotion, future)
+
+    def _notify(self, emotion, future):
+        if self.callback is None or future.cancelled():
+            return
+        error = future.exception()
+        try:
+            self.callback(emotion, None if error else future.result(), error)
+        except Exception:
+            logger.exception("Music lookup callback failed")
+
+
+class SpeculativePrefetcher:
+    """Warms the music cache for the emotions the live stream is most likely to settle on.
+
+    observe(probs) is cheap enough to call on every frame. It fetches the
+    tracks of the `top_n` likeliest emotions with at least `min_probability`,
+    unless they are cached or being fetched already. The budget keeps
+    speculation bounded: at most `max_inflight` fetches at once and
+    `max_per_minute` started per minute.
+    """
+
+    def __init__(self, lookup=None, query=None, top_n=2, min_probability=0.15, max_inflight=2,
+                 max_per_minute=20):
+        self.lookup = lookup or get_music_lookup()
+        self.query = query
+        self.top_n = top_n
+        self.min_probability = min_probability
+        self.max_inflight = max_inflight
+        self.max_per_minute = max_per_minute
+        self.started = 0
+        self.over_budget = 0
+        self._inflight = []
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def observe(self, probs):
+        """Prefetch for the dominant and runner-up emotions of a 7-way probability vector."""
+        if probs is None:
+            return
+        probs = np.asarray(probs)
+        for index in np.argsort(probs)[::-1][:self.top_n]:
+            if probs[index] < self.min_probability:
+                break
+            self.warm(EMOTIONS[index])
+
+    def warm(self, emotion):
+        """Fetch the tracks for an emotion in the background if the budget allows, returns the future or None."""
+        if self.lookup.cached(emotion, self.query):
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._inflight = [future for future in self._inflight if not future.done()]
+            while self._recent and now - self._recent[0] > 60.0:
+                self._recent.popleft()
+            if len(self._inflight) >= self.max_inflight or len(self._recent) >= self.max_per_minute:
+                self.over_budget += 1
+                return None
+            futures = self.lookup.prefetch([emotion], self.query)
+            if not futures:
+                return None
+            self._inflight.append(futures[0])
+            self._recent.append(now)
+            self.started += 1
+            return futures[0]
+
+
+def _failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+def _forward(source, target):
+    try:
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+    except InvalidStateError:
+        # The caller cancelled or timed out first
+        pass
+
+
+def _set_exception(future, error):
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Music prefetch failed: %s", future.exception())
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+def get_music_lookup(prefetch_query=None):
+    """Return the process-wide MusicLookup, created on the first call.
+
+    With prefetch_query the tracks of all emotions for that query template
+    are fetched in the background (already cached ones are skipped), so
+    interfaces can call this on every rerun.
+    """
+    global _lookup
+    with _lookup_lock:
+        if _lookup is None:
+            store = None
+            if CACHE_PATH:
+                try:
+                    store = SQLiteCache(CACHE_PATH)
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning("Music disk cache %s unavailable: %s", CACHE_PATH, e)
+            _lookup = MusicLookup(store=store)
+    if prefetch_query is not None:
+        _lookup.prefetch(query=prefetch_query)
+    return _lookup
+
+
+_prefetchers = {}
+
+
+def get_prefetcher(query=DEFAULT_QUERY):
+    """Return the process-wide SpeculativePrefetcher for a query template, so all sessions share one budget."""
+    lookup = get_music_lookup()
+    with _lookup_lock:
+        if query not in _prefetchers:
+            _prefetchers[query] = SpeculativePrefetcher(lookup, query)
+        return _prefetchers[query]
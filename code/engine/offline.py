@@ -0,0 +1,134 @@
+# Offline annotation of recorded media (video files and image folders).
+# Frames flow through overlapped stages so every core stays busy:
+#   decode (own thread) -> face detection (thread pool) -> batched classification
+# OpenCV releases the GIL in decoding, cvtColor, detectMultiScale and resize,
+# so a thread pool scales with cores without copying frames between processes.
+import glob
+import os
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .inference import _to_predictions
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+# A decoded frame, timestamp is in milliseconds from the start of the video (None for images)
+MediaFrame = namedtuple('MediaFrame', ['source', 'frame_index', 'timestamp', 'image'])
+# The faces found in one frame
+FrameAnnotation = namedtuple('FrameAnnotation', ['source', 'frame_index', 'timestamp', 'predictions'])
+
+
+def list_images(directory):
+    """All images below a directory, sorted by path."""
+    return sorted(p for p in glob.glob(os.path.join(directory, '**', '*'), recursive=True)
+                  if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def iter_media(paths, stride=1):
+    """Yield MediaFrame for every `stride`-th frame of the given videos, images and image folders."""
+    for path in paths:
+        if os.path.isdir(path):
+            # frame_index is the position in the whole folder, like a video's frame number
+            for index, image_path in enumerate(list_images(path)):
+                if index % stride:
+                    continue
+                image = cv2.imread(image_path)
+                if image is not None:
+                    yield MediaFrame(image_path, index, None, image)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(path)
+            if image is not None:
+                yield MediaFrame(path, 0, None, image)
+        else:
+            cap = cv2.VideoCapture(path)
+            index = 0
+            try:
+                while True:
+                    # grab() skips decoding the frames that stride leaves out
+                    if not cap.grab():
+                        break
+                    if index % stride == 0:
+                        ret, image = cap.retrieve()
+                        if not ret:
+                            break
+                        yield MediaFrame(path, index, cap.get(cv2.CAP_PROP_POS_MSEC), image)
+                    index += 1
+            finally:
+                cap.release()
+
+
+def prefetch(iterable, size=8):
+    """Run an iterator in a background thread, keeping up to `size` items ready."""
+    items = queue.Queue(maxsize=size)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, name='decode', daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        yield item
+
+
+def annotate_media(paths, engine, workers=None, batch_size=64, stride=1):
+    """Yield a FrameAnnotation per processed frame, in input order.
+
+    Faces of consecutive frames are collected until there are `batch_size`
+    of them and then classified in one model call.
+    """
+    workers = workers or os.cpu_count() or 1
+    local = threading.local()
+
+    def detect(frame):
+        # Each pool thread gets its own cascade, they cannot be shared between threads
+        if not hasattr(local, 'detect'):
+            local.detect = engine.create_face_detector()
+        gray = engine.to_gray(frame.image)
+        boxes = local.detect(gray)
+        # Copied out of the thread's reused buffer because the crops wait for a batch
+        rois = np.array(engine.preprocess_batch(gray, boxes))
+        # The crops are all that is needed from here on, let the image go
+        return frame._replace(image=None), boxes, rois
+
+    def classify(detected):
+        rois = [frame_rois for _, _, frame_rois in detected if len(frame_rois)]
+        probs = engine.classify(np.concatenate(rois)) if rois else []
+        start = 0
+        for frame, boxes, _ in detected:
+            predictions = _to_predictions(boxes, probs[start:start + len(boxes)])
+            start += len(boxes)
+            yield FrameAnnotation(frame.source, frame.frame_index, frame.timestamp, predictions)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='detect') as pool:
+        pending = deque()
+        detected = []
+        faces = 0
+        frames = prefetch(iter_media(paths, stride), size=2 * workers)
+        while True:
+            # Keep a bounded number of frames in flight so memory does not grow with the input
+            for frame in frames:
+                pending.append(pool.submit(detect, frame))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            result = pending.popleft().result()
+            detected.append(result)
+            faces += len(result[1])
+            if faces >= batch_size or len(detected) >= batch_size:
+                yield from classify(detected)
+                detected, faces = [], 0
+        if detected:
+            yield from classify(detected)
@@ -0,0 +1,82 @@
+# Per-frame timing traces in the Chrome trace-event format. TraceRecorder is a
+# metrics sink (see engine.metrics), so with set_metrics(recorder) every stage
+# timer in the pipeline becomes a span on its thread's timeline. Open the
+# written JSON in chrome://tracing or https://ui.perfetto.dev.
+import json
+import os
+import threading
+import time
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'args', 'start')
+
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder._complete(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class TraceRecorder:
+    """Collects spans and counters as Chrome trace events.
+
+    Stage timers are named after their `stage` label, other timers after
+    the metric name. max_events bounds memory on long runs, later events are dropped.
+    """
+
+    enabled = True
+
+    def __init__(self, max_events=1000000):
+        self.max_events = max_events
+        self.events = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def increment(self, name, amount=1, **labels):
+        self._append({'name': name, 'ph': 'i', 's': 't', 'ts': self._us(time.perf_counter()),
+                      'args': dict(labels, amount=amount)})
+
+    def observe(self, name, value, **labels):
+        self._append({'name': name, 'ph': 'C', 'ts': self._us(time.perf_counter()), 'args': {'value': value}})
+
+    def timer(self, name, **labels):
+        return _Span(self, labels.pop('stage', name), labels)
+
+    def span(self, name, **args):
+        """Context manager recording a named span, e.g. one per frame."""
+        return _Span(self, name, args)
+
+    def write(self, path):
+        """Write the trace as JSON, returns the number of events written."""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+    def _complete(self, name, start, end, args):
+        self._append({'name': name, 'ph': 'X', 'ts': self._us(start), 'dur': (end - start) * 1e6, 'args': args})
+
+    def _us(self, t):
+        return (t - self._origin) * 1e6
+
+    def _append(self, event):
+        thread = threading.current_thread()
+        event['pid'] = os.getpid()
+        event['tid'] = thread.ident
+        with self._lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+                self._threads.setdefault(thread.ident, thread.name)
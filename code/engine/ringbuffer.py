@@ -0,0 +1,129 @@
+# Fixed-size ring of preallocated frame slots in shared memory.
+# The capture side writes each frame straight into the next slot (for
+# example cv2.VideoCapture.read(ring.write_slot())) and consumers in this or
+# another process read numpy views of the newest slot, so frames move between
+# capture, inference and rendering without being copied or pickled.
+#
+# Layout: an int64 header [latest_seq, seq of slot 0, ..., seq of slot n-1]
+# followed by the slot data. Sequence numbers start at 1 and frame `seq`
+# lives in slot seq % slots. A slot's seq is set to -1 while it is being
+# written, so readers can tell whether the view they hold was overwritten.
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_WRITING = -1
+
+
+class SharedFrameRing:
+    """Single-writer, multi-reader ring buffer of frames in shared memory.
+
+    Create it in one process, then pass `spec` to other processes and open it
+    there with SharedFrameRing.attach(**spec). A reader keeps a slot view valid
+    until the writer laps the ring (slots - 1 frames later), which
+    still_valid(seq) checks.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=4, name=None, create=True):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        header_bytes = (slots + 1) * 8
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(name=name, create=create,
+                                               size=header_bytes + frame_bytes * slots)
+        self._owner = create
+        self._header = np.ndarray((slots + 1,), dtype=np.int64, buffer=self._shm.buf)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf,
+                                  offset=header_bytes)
+        if create:
+            self._header[:] = 0
+        self._next_seq = int(self._header[0]) + 1
+
+    @classmethod
+    def attach(cls, name, shape, dtype, slots):
+        """Open a ring created by another process."""
+        return cls(shape, dtype, slots, name=name, create=False)
+
+    @property
+    def spec(self):
+        """Arguments for SharedFrameRing.attach in another process (picklable)."""
+        return {'name': self._shm.name, 'shape': self.shape, 'dtype': self.dtype.str, 'slots': self.slots}
+
+    def write_slot(self):
+        """Return the view to write the next frame into, call commit() once it is filled."""
+        slot = self._next_seq % self.slots
+        self._header[1 + slot] = _WRITING
+        return self._frames[slot]
+
+    def commit(self):
+        """Publish the frame written into the last write_slot(), returns its sequence number."""
+        seq = self._next_seq
+        self._header[1 + seq % self.slots] = seq
+        self._header[0] = seq
+        self._next_seq += 1
+        return seq
+
+    def latest(self, after=0):
+        """Return (seq, view) of the newest frame newer than `after`, or (None, None).
+
+        The view points into shared memory, nothing is copied.
+        """
+        seq = int(self._header[0])
+        if seq <= after:
+            return None, None
+        if self._header[1 + seq % self.slots] != seq:
+            # Overwritten between reading the header and the slot, the writer is far ahead
+            return None, None
+        return seq, self._frames[seq % self.slots]
+
+    def still_valid(self, seq):
+        """True while frame `seq` has not been overwritten, check after using a view."""
+        return self._header[1 + seq % self.slots] == seq
+
+    def close(self):
+        # Drop the numpy views first, shared memory cannot be closed while they exist
+        self._header = None
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def capture_into_ring(source, spec, stop_event, fps_limit=None):
+    """Capture loop meant for a separate process: read frames from `source` into the ring.
+
+    Frames of a different size than the ring slots are resized straight into
+    the slot; otherwise the camera decodes directly into shared memory.
+    """
+    import time
+
+    import cv2
+
+    ring = SharedFrameRing.attach(**spec)
+    cap = cv2.VideoCapture(source)
+    height, width = ring.shape[:2]
+    scratch = None
+    try:
+        while not stop_event.is_set():
+            slot = ring.write_slot()
+            if scratch is None:
+                ret, frame = cap.read(slot)
+                if ret and frame.shape != slot.shape:
+                    # The camera ignores our size, decode elsewhere from now on and resize into the slot
+                    scratch = frame
+                    cv2.resize(frame, (width, height), dst=slot)
+                elif ret and not np.shares_memory(frame, slot):
+                    np.copyto(slot, frame)
+            else:
+                ret, scratch = cap.read(scratch)
+                if ret:
+                    cv2.resize(scratch, (width, height), dst=slot)
+            if not ret:
+                break
+            ring.commit()
+            if fps_limit:
+                time.sleep(1.0 / fps_limit)
+    finally:
+        cap.release()
+        ring.close()
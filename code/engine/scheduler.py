@@ -0,0 +1,137 @@
+# Decouples frame capture from inference. Capture hands every frame to
+# submit(), which only keeps the newest one; a worker thread classifies the
+# newest frame at a rate adapted to how long inference takes, and the capture
+# side keeps drawing the latest result on the frames that were skipped.
+#
+# The newest frame lives in a single slot that submit() replaces with one
+# reference assignment before waking the worker with an Event. The only lock
+# the capture thread (a WebRTC media track, a camera loop) takes is the
+# Event's internal one, held just for set() and never across inference, so it
+# never waits for the worker to finish a frame. Frames carry a sequence
+# number and the worker counts the ones it never saw as dropped.
+import logging
+import threading
+import time
+from collections import deque
+
+from .metrics import DROPPED_FRAMES, get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveScheduler:
+    """Runs `process(frame)` on the newest submitted frame in a background thread.
+
+    target_latency: frames older than this (seconds) when the worker gets to them are dropped
+    max_fps:        never run inference more often than this
+    min_fps:        never wait longer than 1 / min_fps between inferences
+    max_load:       share of the time the worker may be busy, the rest is left to capture and rendering
+    """
+
+    def __init__(self, process, target_latency=0.15, max_fps=30.0, min_fps=1.0, max_load=0.8):
+        self.process = process
+        self.target_latency = target_latency
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_load = max_load
+
+        self.submitted_frames = 0
+        self.dropped_frames = 0
+        self.stale_frames = 0
+        self.processed_frames = 0
+
+        self._slot = None
+        self._taken = 0
+        self._wake = threading.Event()
+        self._result = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._process_time = None
+        self._latency = None
+        self._interval = 1.0 / max_fps
+        self._done_times = deque(maxlen=60)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='inference-worker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, frame):
+        """Offer a frame for inference without blocking; an unprocessed older frame is dropped.
+
+        Call it from one thread only, frames are numbered in the order they are submitted.
+        """
+        self.submitted_frames += 1
+        self._slot = (self.submitted_frames, frame, time.monotonic())
+        self._wake.set()
+
+    @property
+    def result(self):
+        """Result of the most recent inference, None until the first one finishes."""
+        return self._result
+
+    def stats(self):
+        """Counters and rates describing how the scheduler keeps up with the stream."""
+        now = time.monotonic()
+        recent = [t for t in self._done_times if now - t <= 2.0]
+        return {
+            'inference_fps': len(recent) / 2.0,
+            'interval_ms': self._interval * 1000.0,
+            'process_ms': (self._process_time or 0.0) * 1000.0,
+            'latency_ms': (self._latency or 0.0) * 1000.0,
+            'submitted_frames': self.submitted_frames,
+            'processed_frames': self.processed_frames,
+            'dropped_frames': self.dropped_frames,
+            'stale_frames': self.stale_frames,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Clear before reading the slot so a frame submitted after the read wakes us again
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            slot = self._slot
+            if slot is None or slot[0] <= self._taken:
+                continue
+            seq, frame, submitted = slot
+            superseded = seq - self._taken - 1
+            self._taken = seq
+            if superseded:
+                self.dropped_frames += superseded
+                get_metrics().increment(DROPPED_FRAMES, superseded, reason='superseded')
+
+            if time.monotonic() - submitted > self.target_latency:
+                self.stale_frames += 1
+                get_metrics().increment(DROPPED_FRAMES, reason='stale')
+                continue
+
+            start = time.monotonic()
+            try:
+                self._result = self.process(frame)
+            except Exception:
+                logger.exception("Inference failed")
+                continue
+            done = time.monotonic()
+            self.processed_frames += 1
+            self._done_times.append(done)
+            self._process_time = _ema(self._process_time, done - start)
+            self._latency = _ema(self._latency, done - submitted)
+
+            # Run as often as the CPU budget allows, within [min_fps, max_fps]
+            self._interval = min(max(1.0 / self.max_fps, self._process_time / self.max_load), 1.0 / self.min_fps)
+            self._stop.wait(max(0.0, self._interval - (done - start)))
+
+
+def _ema(previous, value, alpha=0.2):
+    return value if previous is None else previous + alpha * (value - previous)
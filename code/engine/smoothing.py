@@ -0,0 +1,104 @@
+# Turns the noisy per-frame softmax output into a stable mood per face.
+# Each face keeps an exponential moving average of its probabilities; the
+# stable mood only changes when another emotion has led the average by a
+# margin for several frames in a row (hysteresis), and every change is
+# reported once through the on_change callback.
+from collections import namedtuple
+
+import numpy as np
+
+from .config import EMOTIONS
+
+# Fired when the stable mood of a face changes, previous is None for a new face
+MoodChange = namedtuple('MoodChange', ['face_id', 'previous', 'current'])
+
+
+class _FaceMood:
+    def __init__(self, probs):
+        self.ema = np.array(probs, dtype=np.float32)
+        self.stable = None
+        self.candidate = None
+        self.candidate_frames = 0
+        self.missing = 0
+
+
+class EmotionSmoother:
+    """Per-face rolling aggregation of the emotion probabilities.
+
+    alpha:          weight of the newest frame in the moving average
+    min_confidence: smoothed probability an emotion needs before it can become the mood
+    margin:         how far the new emotion must lead the current mood
+    hold_frames:    consecutive frames the new emotion must keep that lead
+    max_missing:    frames a face may be absent before its state is dropped
+    on_change:      called with a MoodChange whenever a stable mood changes
+    """
+
+    def __init__(self, alpha=0.3, min_confidence=0.4, margin=0.1, hold_frames=5, max_missing=15,
+                 on_change=None):
+        self.alpha = alpha
+        self.min_confidence = min_confidence
+        self.margin = margin
+        self.hold_frames = hold_frames
+        self.max_missing = max_missing
+        self.on_change = on_change
+        self._faces = {}
+
+    def update(self, predictions):
+        """Feed the predictions of one frame, returns them with smoothed probs and stable labels.
+
+        Faces are keyed by face_id, so use a FaceTracker when there can be
+        more than one face; without IDs all predictions count as one face.
+        """
+        smoothed = []
+        seen = set()
+        for prediction in predictions:
+            face_id = prediction.face_id
+            seen.add(face_id)
+            state = self._faces.get(face_id)
+            if state is None:
+                state = self._faces[face_id] = _FaceMood(prediction.probs)
+            else:
+                state.ema += self.alpha * (np.asarray(prediction.probs, dtype=np.float32) - state.ema)
+                state.missing = 0
+            self._step(face_id, state)
+            label = state.stable if state.stable is not None else EMOTIONS[int(np.argmax(state.ema))]
+            smoothed.append(prediction._replace(label=label, probs=state.ema.copy()))
+
+        for face_id in list(self._faces):
+            if face_id not in seen:
+                state = self._faces[face_id]
+                state.missing += 1
+                if state.missing > self.max_missing:
+                    del self._faces[face_id]
+        return smoothed
+
+    def mood(self, face_id=None):
+        """Stable mood of a face, None until one has been established."""
+        state = self._faces.get(face_id)
+        return state.stable if state is not None else None
+
+    def reset(self):
+        self._faces = {}
+
+    def _step(self, face_id, state):
+        top = int(np.argmax(state.ema))
+        label = EMOTIONS[top]
+        if label == state.stable:
+            state.candidate, state.candidate_frames = None, 0
+            return
+
+        leads = state.ema[top] >= self.min_confidence
+        if leads and state.stable is not None:
+            leads = state.ema[top] - state.ema[EMOTIONS.index(state.stable)] >= self.margin
+        if not leads:
+            state.candidate, state.candidate_frames = None, 0
+            return
+
+        if label != state.candidate:
+            state.candidate, state.candidate_frames = label, 0
+        state.candidate_frames += 1
+        if state.candidate_frames >= self.hold_frames:
+            previous, state.stable = state.stable, label
+            state.candidate, state.candidate_frames = None, 0
+            if self.on_change is not None:
+                self.on_change(MoodChange(face_id, previous, label))
@@ -0,0 +1,237 @@
+# Multi-stream processing: one capture thread per video source and a single
+# shared inference worker. Capture threads detect/track faces and hand their
+# crops to the worker, which classifies the crops of all streams together in
+# batches, so adding a camera adds a thread rather than another model.
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from .config import EMOTIONS
+from .inference import _count_predictions, _to_predictions
+from .metrics import DROPPED_FRAMES, FACES_PER_FRAME, FRAMES, STAGE_SECONDS, get_metrics
+from .smoothing import EmotionSmoother
+
+logger = logging.getLogger(__name__)
+
+# One processed frame of one stream
+StreamResult = namedtuple('StreamResult', ['stream_id', 'frame_index', 'timestamp', 'predictions'])
+
+
+class BatchingInferenceWorker:
+    """Classifies face crops submitted from many threads in shared batches.
+
+    A batch is sent to the model as soon as it holds `max_batch` crops or
+    `max_wait` seconds after its first request arrived, whichever is first.
+    """
+
+    def __init__(self, engine, max_batch=32, max_wait=0.01):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.crops = 0
+        self._requests = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='batch-inference', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, rois):
+        """Queue preprocessed crops (N, 64, 64, 1), returns a Future of their (N, 7) probabilities."""
+        future = Future()
+        if len(rois) == 0:
+            future.set_result(np.zeros((0, len(EMOTIONS)), dtype=np.float32))
+        else:
+            self._requests.put((rois, future))
+        return future
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'crops': self.crops,
+            'mean_batch': self.crops / self.batches if self.batches else 0.0,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self._requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            try:
+                probs = self.engine.classify(np.concatenate([rois for rois, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.crops += size
+            start = 0
+            for rois, future in batch:
+                future.set_result(probs[start:start + len(rois)])
+                start += len(rois)
+
+
+class StreamProcessor:
+    """Reads one video source in its own thread and publishes a StreamResult per frame.
+
+    `source` is anything cv2.VideoCapture accepts: a device index, a video
+    file or a network URL (rtsp://, http://). Results go to `output`, a queue
+    that keeps only the newest `output_size` results when nobody reads it.
+    """
+
+    def __init__(self, stream_id, source, engine, worker, detect_interval=10, output_size=100,
+                 loop=False, detector_options=None):
+        self.stream_id = stream_id
+        self.source = source
+        self.engine = engine
+        self.worker = worker
+        self.detect_interval = detect_interval
+        self.loop = loop
+        # Passed to engine.create_face_detector, e.g. tile_size for high-resolution sources
+        self.detector_options = detector_options or {}
+        self.output = queue.Queue(maxsize=output_size)
+        self.frames = 0
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f'stream-{self.stream_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _publish(self, result):
+        while True:
+            try:
+                self.output.put_nowait(result)
+                return
+            except queue.Full:
+                # The consumer fell behind, drop its oldest result instead of blocking capture
+                try:
+                    self.output.get_nowait()
+                    get_metrics().increment(DROPPED_FRAMES, reason='output_full')
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        source = int(self.source) if str(self.source).isdigit() else self.source
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            logger.error("Stream %s: cannot open %s", self.stream_id, self.source)
+            self.finished.set()
+            return
+
+        detect = None
+        smoother = EmotionSmoother()
+        metrics = get_metrics()
+        try:
+            # Inside the try so a bad detector setup (missing model file, tiling with a CNN
+            # detector) still releases the capture and marks the stream finished
+            detect = self.engine.create_face_detector(**self.detector_options)
+            tracker = self.engine.create_tracker(self.detect_interval, detect=detect)
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    if self.loop and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        tracker.reset()
+                        continue
+                    break
+
+                metrics.increment(FRAMES)
+                with metrics.timer(STAGE_SECONDS, stage='gray'):
+                    gray = self.engine.to_gray(frame)
+                with metrics.timer(STAGE_SECONDS, stage='track'):
+                    tracked = tracker.update(gray)
+                boxes = [box for _, box in tracked]
+                metrics.observe(FACES_PER_FRAME, len(boxes))
+                with metrics.timer(STAGE_SECONDS, stage='preprocess'):
+                    rois = self.engine.preprocess_batch(gray, boxes)
+                # The crops live in this thread's reused buffer, which is safe because we wait for the result
+                with metrics.timer(STAGE_SECONDS, stage='predict'):
+                    probs = self.worker.submit(rois).result()
+                raw = _to_predictions(boxes, probs, [face_id for face_id, _ in tracked])
+                _count_predictions(metrics, raw)
+                predictions = smoother.update(raw)
+
+                self._publish(StreamResult(self.stream_id, self.frames, time.time(), predictions))
+                self.frames += 1
+        except Exception:
+            logger.exception("Stream %s failed", self.stream_id)
+        finally:
+            cap.release()
+            if hasattr(detect, 'close'):
+                detect.close()
+            self.finished.set()
+
+
+class MultiStreamServer:
+    """Runs a StreamProcessor per source around one shared BatchingInferenceWorker."""
+
+    def __init__(self, sources, engine, max_batch=32, max_wait=0.01, detect_interval=10, loop=False,
+                 detector_options=None):
+        self.worker = BatchingInferenceWorker(engine, max_batch=max_batch, max_wait=max_wait)
+        self.streams = {
+            str(stream_id): StreamProcessor(str(stream_id), source, engine, self.worker,
+                                            detect_interval=detect_interval, loop=loop,
+                                            detector_options=detector_options)
+            for stream_id, source in (sources.items() if isinstance(sources, dict) else enumerate(sources))
+        }
+
+    def start(self):
+        self.worker.start()
+        for stream in self.streams.values():
+            stream.start()
+        return self
+
+    def stop(self):
+        for stream in self.streams.values():
+            stream.stop()
+        self.worker.stop()
+
+    def running(self):
+        return any(not stream.finished.is_set() for stream in self.streams.values())
+
+    def output(self, stream_id):
+        """Queue of StreamResult for one stream."""
+        return self.streams[str(stream_id)].output
+
+    def stats(self):
+        stats = {'worker': self.worker.stats()}
+        stats.update({stream_id: {'frames': stream.frames} for stream_id, stream in self.streams.items()})
+        return stats
@@ -0,0 +1,171 @@
+# Parallel face detection for high-resolution frames.
+# detectMultiScale runs on one core, and its cost grows with the frame area,
+# so a 1080p frame is split into overlapping tiles that are searched in
+# parallel. Tiles only look for faces smaller than the overlap (any such face
+# is then fully inside at least one tile); bigger faces are found by one extra
+# pass over a half-size copy of the frame. Duplicates along the tile seams are
+# merged afterwards.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """Return (x0, y0, x1, y1) tiles of at most tile_size covering the frame, overlapping by `overlap`."""
+    tile_w, tile_h = tile_size
+    step_x, step_y = max(1, tile_w - overlap), max(1, tile_h - overlap)
+    xs = list(range(0, max(1, width - overlap), step_x))
+    ys = list(range(0, max(1, height - overlap), step_y))
+    return [(x, y, min(x + tile_w, width), min(y + tile_h, height)) for y in ys for x in xs]
+
+
+def merge_boxes(boxes, overlap_threshold=0.5):
+    """Merge boxes that describe the same face.
+
+    Two boxes are duplicates when their intersection covers more than
+    `overlap_threshold` of the smaller one, which also catches a face cut by
+    a tile seam. The larger box of each group is kept.
+    """
+    if len(boxes) == 0:
+        return []
+    boxes = np.array(boxes, dtype=np.int64)
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-areas)
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(tuple(int(v) for v in boxes[i]))
+        x0 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y0 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x1 = np.minimum(boxes[i, 0] + boxes[i, 2], boxes[rest, 0] + boxes[rest, 2])
+        y1 = np.minimum(boxes[i, 1] + boxes[i, 3], boxes[rest, 1] + boxes[rest, 3])
+        inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+        smaller = np.minimum(areas[i], areas[rest])
+        order = rest[inter / smaller <= overlap_threshold]
+    return keep
+
+
+def _detect(cascade, gray, region, scale_factor, min_neighbors, min_size, max_size, downscale):
+    """Detect faces inside region (x0, y0, x1, y1) of gray, boxes are returned in frame coordinates."""
+    x0, y0, x1, y1 = region
+    image = gray[y0:y1, x0:x1]
+    if downscale != 1:
+        image = cv2.resize(image, None, fx=1.0 / downscale, fy=1.0 / downscale, interpolation=cv2.INTER_AREA)
+    faces = cascade.detectMultiScale(image, scaleFactor=scale_factor, minNeighbors=min_neighbors,
+                                     minSize=min_size, maxSize=max_size)
+    return [(int(x * downscale) + x0, int(y * downscale) + y0, int(w * downscale), int(h * downscale))
+            for (x, y, w, h) in faces]
+
+
+# State of a detection worker process, set up once by _init_process
+_process_state = {}
+
+
+def _init_process(cascade_path, shm_name, capacity):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _process_state['cascade'] = cv2.CascadeClassifier(cascade_path)
+    _process_state['shm'] = shm
+    _process_state['buffer'] = np.ndarray((capacity,), dtype=np.uint8, buffer=shm.buf)
+
+
+def _detect_in_process(shape, *args):
+    # The frame is read straight out of shared memory, nothing is pickled but the coordinates
+    gray = _process_state['buffer'][:shape[0] * shape[1]].reshape(shape)
+    return _detect(_process_state['cascade'], gray, *args)
+
+
+class TiledFaceDetector:
+    """Callable face detector that splits large frames into tiles searched in parallel.
+
+    mode='thread' uses a thread pool (OpenCV releases the GIL while detecting).
+    mode='process' uses a process pool; each frame is written once into a
+    shared-memory buffer that the worker processes read their tiles from.
+    Frames no larger than one tile are searched directly.
+    """
+
+    def __init__(self, cascade_path, scale_factor=1.3, min_neighbors=5, tile_size=(640, 640), overlap=160,
+                 workers=None, mode='thread'):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"mode must be 'thread' or 'process', not {mode!r}")
+        self.cascade_path = cascade_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.tile_size = tuple(tile_size)
+        self.overlap = overlap
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self._cascade = cv2.CascadeClassifier(cascade_path)
+        if self._cascade.empty():
+            raise ValueError(f"Failed to load Haar cascade classifier from {cascade_path}")
+        self._pool = None
+        self._shm = None
+        self._capacity = 0
+        self._thread_cascades = {}
+
+    def __call__(self, gray):
+        height, width = gray.shape[:2]
+        if width <= self.tile_size[0] and height <= self.tile_size[1]:
+            return _detect(self._cascade, gray, (0, 0, width, height), self.scale_factor, self.min_neighbors,
+                           (0, 0), (0, 0), 1)
+
+        # Small faces in the full-resolution tiles, large faces in one half-size pass
+        small = (self.overlap, self.overlap)
+        jobs = [(tile, self.scale_factor, self.min_neighbors, (0, 0), small, 1)
+                for tile in tile_grid(width, height, self.tile_size, self.overlap)]
+        jobs.append(((0, 0, width, height), self.scale_factor, self.min_neighbors,
+                     (self.overlap // 2, self.overlap // 2), (0, 0), 2))
+
+        if self.mode == 'process':
+            futures = self._submit_process_jobs(gray, jobs)
+        else:
+            futures = [self._get_pool().submit(self._detect_in_thread, gray, *job) for job in jobs]
+        boxes = [box for future in futures for box in future.result()]
+        return merge_boxes(boxes)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        # The next process-mode call has to allocate a new buffer and pool
+        self._capacity = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tile-detect')
+        return self._pool
+
+    def _detect_in_thread(self, gray, *args):
+        # One cascade per pool thread, a CascadeClassifier cannot be shared between threads
+        ident = threading.get_ident()
+        if ident not in self._thread_cascades:
+            self._thread_cascades[ident] = cv2.CascadeClassifier(self.cascade_path)
+        return _detect(self._thread_cascades[ident], gray, *args)
+
+    def _submit_process_jobs(self, gray, jobs):
+        size = gray.shape[0] * gray.shape[1]
+        if size > self._capacity:
+            # (Re)create the shared buffer and the pool attached to it for the bigger frame size
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._capacity = size
+            # Spawned, not forked: the callers (stream threads, the inference worker) are threaded
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_process,
+                                             initargs=(self.cascade_path, self._shm.name, size))
+        np.ndarray((size,), dtype=np.uint8, buffer=self._shm.buf)[:] = gray.reshape(-1)
+        return [self._pool.submit(_detect_in_process, gray.shape[:2], *job) for job in jobs]
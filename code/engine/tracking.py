@@ -0,0 +1,149 @@
+# Detect-then-track: run the (expensive) face detector only every few frames
+# and follow the faces in between with sparse optical flow, which costs a
+# fraction of a full-frame detectMultiScale.
+import itertools
+
+import cv2
+import numpy as np
+
+# Lucas-Kanade parameters, small windows are enough for face motion between consecutive frames
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    def __init__(self, face_id, box):
+        self.face_id = face_id
+        self.box = box
+        self.points = None
+
+
+class FaceTracker:
+    """Keeps face boxes and stable per-face IDs across frames.
+
+    `detect` is a function taking a grayscale image and returning (x, y, w, h)
+    boxes, usually FacialEmotionEngine.detect_faces. It is called on the first
+    frame, every `detect_interval` frames, whenever nothing is being tracked
+    and as soon as a track loses too many of its feature points.
+    """
+
+    def __init__(self, detect, detect_interval=10, min_confidence=0.6, max_points=30, min_points=5,
+                 match_iou=0.3):
+        self.detect = detect
+        self.detect_interval = detect_interval
+        self.min_confidence = min_confidence
+        self.max_points = max_points
+        self.min_points = min_points
+        self.match_iou = match_iou
+        self.frames = 0
+        self.detections = 0
+        self._ids = itertools.count(1)
+        self._tracks = []
+        self._prev_gray = None
+        self._since_detect = 0
+
+    def reset(self):
+        """Forget all faces, the next update runs the detector."""
+        self._tracks = []
+        self._since_detect = 0
+
+    def update(self, gray):
+        """Return [(face_id, box), ...] for the faces in this grayscale frame."""
+        self.frames += 1
+        lost = False
+        if self._prev_gray is not None and self._prev_gray.shape == gray.shape and self._tracks:
+            lost = not self._track(gray)
+
+        if lost or not self._tracks or self._since_detect >= self.detect_interval:
+            self._redetect(gray)
+        else:
+            self._since_detect += 1
+
+        # Keep our own copy, callers may reuse their gray buffer for the next frame
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            self._prev_gray = np.empty_like(gray)
+        np.copyto(self._prev_gray, gray)
+        return [(track.face_id, track.box) for track in self._tracks]
+
+    def _track(self, gray):
+        """Move every track with optical flow, returns False when one of them is no longer reliable."""
+        height, width = gray.shape[:2]
+        reliable = True
+        for track in self._tracks:
+            if track.points is None or len(track.points) < self.min_points:
+                reliable = False
+                continue
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, track.points, None, **LK_PARAMS)
+            good = status.reshape(-1) == 1
+            if good.sum() < self.min_points or good.mean() < self.min_confidence:
+                reliable = False
+                continue
+
+            old_good = track.points[good].reshape(-1, 2)
+            new_good = new_points[good].reshape(-1, 2)
+            dx, dy = np.median(new_good - old_good, axis=0)
+
+            # Follow the face getting closer or further away from the spread of the points
+            old_spread = np.median(np.linalg.norm(old_good - old_good.mean(axis=0), axis=1))
+            new_spread = np.median(np.linalg.norm(new_good - new_good.mean(axis=0), axis=1))
+            scale = new_spread / old_spread if old_spread > 0 else 1.0
+
+            x, y, w, h = track.box
+            cx, cy = x + w / 2.0 + dx, y + h / 2.0 + dy
+            w, h = w * scale, h * scale
+            box = _clip_box((cx - w / 2.0, cy - h / 2.0, w, h), width, height)
+            if box is None:
+                reliable = False
+                continue
+            track.box = box
+            track.points = new_good.reshape(-1, 1, 2).astype(np.float32)
+        return reliable
+
+    def _redetect(self, gray):
+        boxes = self.detect(gray)
+        self.detections += 1
+        self._since_detect = 0
+
+        # Keep the ID of the track each detection overlaps most
+        unmatched = list(self._tracks)
+        tracks = []
+        for box in boxes:
+            best = max(unmatched, key=lambda track: box_iou(track.box, box), default=None)
+            if best is not None and box_iou(best.box, box) >= self.match_iou:
+                unmatched.remove(best)
+                track = best
+                track.box = tuple(box)
+            else:
+                track = _Track(next(self._ids), tuple(box))
+            track.points = self._seed_points(gray, track.box)
+            tracks.append(track)
+        self._tracks = tracks
+
+    def _seed_points(self, gray, box):
+        x, y, w, h = box
+        points = cv2.goodFeaturesToTrack(gray[y:y + h, x:x + w], maxCorners=self.max_points,
+                                         qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return None
+        return (points + np.array([x, y], dtype=np.float32)).astype(np.float32)
+
+
+def _clip_box(box, width, height):
+    """Round a float box and clip it to the frame, None if little of it is left."""
+    x, y, w, h = box
+    x0, y0 = max(0, int(round(x))), max(0, int(round(y)))
+    x1, y1 = min(width, int(round(x + w))), min(height, int(round(y + h)))
+    if x1 - x0 < 8 or y1 - y0 < 8:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
@@ -0,0 +1,82 @@
+# Server-side emotion recognition for streamlit-webrtc streams, shared by the
+# Streamlit WebRTC apps. recv runs on the media track and only hands the frame
+# to an AdaptiveScheduler worker and draws the latest result, so video keeps
+# the camera's frame rate while inference runs as fast as the CPU allows.
+# Not imported by engine/__init__ so the other interfaces do not need
+# streamlit-webrtc and av; import it as engine.webrtc.
+import time
+
+import av
+import cv2
+from streamlit_webrtc import VideoProcessorBase
+
+from .inference import draw_predictions, get_engine, primary_prediction
+from .music import DEFAULT_QUERY, get_prefetcher
+from .scheduler import AdaptiveScheduler
+from .smoothing import EmotionSmoother
+
+
+class EmotionVideoProcessor(VideoProcessorBase):
+    """streamlit-webrtc video processor that overlays the detected emotions.
+
+    last_emotion is written only by the inference worker and read by the
+    script through ctx.video_processor; replacing a str is atomic, so it
+    needs no lock and st.session_state is never touched from WebRTC threads.
+    """
+
+    def __init__(self, music_query=DEFAULT_QUERY, detect_interval=10):
+        self.music_query = music_query
+        self.detect_interval = detect_interval
+        self.last_emotion = "Neutral"
+        # Created by the worker on its first frame, see predict
+        self.tracker = None
+        # Smooth the per-frame predictions into a stable mood per face
+        self.smoother = EmotionSmoother()
+        # Inference runs in its own thread on the newest frame, recv never waits for it
+        self.scheduler = AdaptiveScheduler(self.predict).start()
+
+    def predict(self, img):
+        engine = get_engine()
+        if self.tracker is None:
+            # Detect faces every few frames and track them in between
+            self.tracker = engine.create_tracker(detect_interval=self.detect_interval)
+        predictions = self.smoother.update(engine.predict_frame(img, self.tracker))
+
+        if predictions:
+            primary = primary_prediction(predictions)
+            # Warm songs for the likeliest moods (dominant and runner-up) before one is captured
+            get_prefetcher(self.music_query).observe(primary.probs)
+            mood = self.smoother.mood(primary.face_id)
+            # Only publish the mood when it actually changed, not on every noisy frame
+            if mood is not None and mood != self.last_emotion:
+                self.last_emotion = mood
+        return predictions
+
+    def recv(self, frame):
+        img = frame.to_ndarray(format="bgr24")
+        self.scheduler.submit(img.copy())
+
+        # Draw the latest result, which may come from a slightly older frame
+        draw_predictions(img, self.scheduler.result or [], color=(0, 255, 0), text_color=(36, 255, 12))
+        stats = self.scheduler.stats()
+        cv2.putText(img, f"Inference: {stats['inference_fps']:.1f} FPS, dropped {stats['dropped_frames']}",
+                    (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (36, 255, 12), 1)
+        return av.VideoFrame.from_ndarray(img, format="bgr24")
+
+    def on_ended(self):
+        # Called by streamlit-webrtc when the stream stops
+        self.scheduler.stop()
+
+
+def follow_mood(ctx, song_lookup, placeholder, interval=0.5):
+    """Show the processor's mood and start its song lookup while the stream plays.
+
+    Runs in the Streamlit script thread, so session state is only used there.
+    placeholder is an st.empty() slot and song_lookup a MoodLookup. A widget
+    interaction reruns the script, which ends the loop.
+    """
+    while ctx.state.playing and ctx.video_processor:
+        mood = ctx.video_processor.last_emotion
+        placeholder.markdown(f"**Current Mood:** `{mood}`")
+        song_lookup.request(mood)
+        time.sleep(interval)
@@ -1,16 +1,21 @@
 import cv2
 import PySimpleGUI as sg
-from keras.models import load_model
 import numpy as np
 import webbrowser
+import multiprocessing
 from threading import Thread, Event
-import requests
-import re
+import os
+import sys
 import time
 
-model = load_model('code/model/fer2013_mini_XCEPTION.102-0.66.hdf5')
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (EmotionSmoother, MoodLookup, SharedFrameRing, capture_into_ring, draw_predictions,
+                    enable_metrics, get_engine, get_music_lookup, get_prefetcher, primary_prediction)
+
 DEFAULT_CAMERA_INDEX = 0
+MUSIC_QUERY = '{emotion} weekend beats'
+FRAME_SHAPE = (480, 640, 3)
 
 def emoji_for(emotion):
     mapping = {
@@ -38,49 +43,61 @@ def color_for_emotion(emotion):
     }
     return mapping.get(emotion, ('#2196F3', '#E3F2FD'))
 
-def detect_emotion(frame, face_cascade):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
-    for (x, y, w, h) in faces:
-        roi_gray = gray[y:y + h, x:x + w]
-        roi_gray = cv2.resize(roi_gray, (64, 64), interpolation=cv2.INTER_AREA)
-        roi = roi_gray / 255.0
-        roi = np.reshape(roi, (1, 64, 64, 1))
-        prediction = model.predict(roi)
-        emotion_label = emotions[np.argmax(prediction)]
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 120, 255), 2)
-        cv2.putText(frame, emotion_label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 120, 255), 2)
-        return frame, emotion_label
+def detect_emotion(frame, tracker=None, smoother=None):
+    # The model is loaded on first use, so the capture process never imports it
+    predictions = get_engine().predict_frame(frame, tracker)
+    if smoother is not None:
+        predictions = smoother.update(predictions)
+    if predictions:
+        draw_predictions(frame, predictions, color=(0, 120, 255))
+        primary = primary_prediction(predictions)
+        # Warm songs for the likeliest moods (dominant and runner-up) before Play is pressed
+        get_prefetcher(MUSIC_QUERY).observe(primary.probs)
+        return frame, primary.label
     return None, None  # Return None when no faces are detected
 
-def play_song_with_emotion(emotion, window):
-    search_query = f"https://www.youtube.com/results?search_query={emotion}+weekend+beats"
-    response = requests.get(search_query)
-    html_content = response.text
-    match = re.search(r'/watch\?v=([^\"]+)', html_content)
-    if match:
-        video_id = match.group(1)
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        webbrowser.open(video_url)
+def play_song_with_emotion(tracks):
+    # Opens the first track of a finished lookup, returns its url or None when nothing was found
+    if not tracks:
+        return None
+    webbrowser.open(tracks[0].url)
+    return tracks[0].url
 
 def video_worker(window, stop_event, cam_idx):
-    cap = cv2.VideoCapture(cam_idx)
-    if not cap.isOpened():
-        window.write_event_value('-STATUS-', ('Cannot open camera', 'bad'))
-        return
-
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    # The camera is read in its own process, straight into shared-memory frame slots
+    ring = SharedFrameRing(FRAME_SHAPE, slots=4)
+    # Spawn instead of fork: this process already runs the GUI, lookup and metrics threads,
+    # and a forked child can inherit a lock one of them held and deadlock
+    context = multiprocessing.get_context('spawn')
+    capture_stop = context.Event()
+    capture = context.Process(target=capture_into_ring, args=(cam_idx, ring.spec, capture_stop), daemon=True)
+    capture.start()
+
+    # Detect faces every 10 frames and track them in between
+    tracker = get_engine().create_tracker(detect_interval=10)
+    smoother = EmotionSmoother()
+    # Overlays are drawn into this buffer, never into the shared slots
+    frame = np.empty(FRAME_SHAPE, dtype=np.uint8)
+    seq = 0
     prev_time = time.time()
     fps = 0.0
 
     while not stop_event.is_set():
-        ret, frame = cap.read()
-        if not ret:
-            window.write_event_value('-STATUS-', ('Camera read failed', 'bad'))
-            break
-
-        frame = cv2.resize(frame, (640, 480))
-        frame_with_faces, detection = detect_emotion(frame, face_cascade)
+        new_seq, slot = ring.latest(after=seq)
+        if new_seq is None:
+            if not capture.is_alive():
+                status = 'Cannot open camera' if seq == 0 else 'Camera read failed'
+                window.write_event_value('-STATUS-', (status, 'bad'))
+                break
+            time.sleep(0.002)
+            continue
+        seq = new_seq
+
+        np.copyto(frame, slot)
+        if not ring.still_valid(seq):
+            # The capture process overwrote the slot while it was copied, wait for a newer frame
+            continue
+        frame_with_faces, detection = detect_emotion(frame, tracker, smoother)
         frame_to_show = frame_with_faces if frame_with_faces is not None else frame
 
         now = time.time()
@@ -93,7 +110,9 @@ def video_worker(window, stop_event, cam_idx):
             {'img': imgbytes, 'emotion': detection, 'fps': fps}
         )
 
-    cap.release()
+    capture_stop.set()
+    capture.join(timeout=2.0)
+    ring.close()
 
 def build_layout():
     sg.theme('LightBlue2')
@@ -152,6 +171,12 @@ def gui_thread():
     video_thread = Thread(target=video_worker, args=(window, stop_event, DEFAULT_CAMERA_INDEX), daemon=True)
     video_thread.start()
 
+    # Lookups never block the event loop (frames keep coming), results arrive as -SONG- events
+    def on_song(emotion, tracks, error):
+        window.write_event_value('-SONG-', (emotion, tracks, error))
+
+    songs = MoodLookup(get_music_lookup(), MUSIC_QUERY, timeout=10.0, callback=on_song)
+
     current_emotion = None
     window_closed = False
 
@@ -175,6 +200,9 @@ def gui_thread():
             except Exception:
                 continue
 
+            # Labels are smoothed, so only touch the emotion widgets when the mood changes
+            if data['emotion'] == current_emotion:
+                continue
             if data['emotion']:
                 current_emotion = data['emotion']
                 window['-EMOTION-TEXT-'].update(f"{emoji_for(current_emotion)} {current_emotion}")
@@ -199,9 +227,15 @@ def gui_thread():
             if not current_emotion:
                 window['-RETURN-VALUE-'].update('Capture an emotion first.')
             else:
-                url = play_song_with_emotion(current_emotion, window)
-                window['-RETURN-VALUE-'].update(f'Playing: {url}' if url else 'Failed to fetch a YouTube link.')
+                window['-RETURN-VALUE-'].update(f'Finding a {current_emotion} song...')
+                songs.request(current_emotion)
+
+        elif event == '-SONG-':
+            emotion, tracks, error = values['-SONG-']
+            url = play_song_with_emotion(tracks)
+            window['-RETURN-VALUE-'].update(f'Playing: {url}' if url else 'Failed to fetch a YouTube link.')
 
+    songs.cancel()
     stop_event.set()
     video_thread.join(timeout=2.0)
     try:
@@ -210,4 +244,8 @@ def gui_thread():
         pass
 
 if __name__ == '__main__':
+    # Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set (not in the capture process)
+    enable_metrics()
+    # Look up songs for every emotion in the background while the camera runs
+    get_music_lookup(prefetch_query=MUSIC_QUERY)
     gui_thread()
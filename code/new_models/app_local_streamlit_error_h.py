@@ -1,14 +1,23 @@
 import streamlit as st
 import cv2
-from keras.models import load_model
-import numpy as np
 import webbrowser
-import requests
-import re
 import os
+import sys
 import time
 import logging
 
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (MoodLookup, draw_predictions, enable_metrics, get_engine, get_music_lookup,
+                    get_prefetcher, primary_prediction)
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Songs for every emotion are looked up once per process in the background and cached
+MUSIC_QUERY = '{emotion} background tunes'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
+
 # Set up logging to track errors for debugging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,13 +35,9 @@ except Exception as e:
 
 # Load model and face detector: Try to load the emotion model and face detection file
 try:
-    model = load_model("Music-Recommendation-Using-Facial-Expressions\\code\\model\\fer2013_mini_XCEPTION.102-0.66.hdf5")
-    emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
-    # Check if face detector loaded correctly
-    if face_cascade.empty():
-        raise ValueError("Failed to load Haar cascade classifier")
+    # The engine is loaded once per process and reused by every rerun, it raises if the
+    # model or the face detector file cannot be loaded
+    engine = get_engine()
 except Exception as e:
     # Show error if model or face detector fails to load and stop the app
     st.error(f"Error loading model or cascade classifier: {str(e)}")
@@ -78,25 +83,21 @@ if "last_emotion" not in st.session_state:
     st.session_state.last_emotion = "Neutral"
 if "show_video" not in st.session_state:
     st.session_state.show_video = False
+if "song_lookup" not in st.session_state:
+    # Song lookups run in the background, a newer mood cancels the lookup for the previous one
+    st.session_state.song_lookup = MoodLookup(music, MUSIC_QUERY, timeout=10.0)
 
 # Function to detect emotion: Process a frame to find faces and predict emotion
 def detect_emotion(frame):
     try:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
         emotion = st.session_state.last_emotion
-        for (x, y, w, h) in faces:
-            roi_gray = gray[y:y+h, x:x+w]
-            roi_gray = cv2.resize(roi_gray, (64, 64))
-            roi = roi_gray.astype("float") / 255.0
-            roi = np.expand_dims(roi, axis=0)
-            roi = np.expand_dims(roi, axis=-1)
-            preds = model.predict(roi)[0]
-            emotion = emotions[np.argmax(preds)]
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, emotion, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
-            break
+        predictions = engine.predict_frame(frame)
+        if predictions:
+            primary = primary_prediction(predictions)
+            emotion = primary.label
+            # Warm songs for the likeliest moods (dominant and runner-up) before one is captured
+            get_prefetcher(MUSIC_QUERY).observe(primary.probs)
+            draw_predictions(frame, predictions, color=(0, 255, 0), text_color=(36, 255, 12))
         return frame, emotion
     except Exception as e:
         # If emotion detection fails, log error and return last known emotion
@@ -144,6 +145,8 @@ if not st.session_state.show_video:
                 frame = cv2.resize(frame, (320, 240))
                 frame, detected_emotion = detect_emotion(frame)
                 st.session_state.last_emotion = detected_emotion
+                # Find a song for the current mood while the feed keeps running
+                st.session_state.song_lookup.request(detected_emotion)
 
                 # Update live KPI and video feed
                 emotion_colors = {
@@ -216,21 +219,15 @@ if st.session_state.show_video:
             st.rerun()
 
         # YouTube integration: Search for a video matching the detected emotion
-        search_query = f"https://www.youtube.com/results?search_query={st.session_state.last_emotion}+background+tunes"
-        
         try:
-            # Try to fetch YouTube search results with a timeout
-            response = requests.get(search_query, timeout=10)
-            if response.status_code != 200:
-                raise Exception(f"HTTP {response.status_code}")
-            
-            html_content = response.text
-            match = re.search(r'/watch\?v=([^\"]+)', html_content)
-            if not match:
+            # Usually finished while the camera was running, fails after the lookup timeout
+            with st.spinner("Finding a song for your mood..."):
+                tracks = st.session_state.song_lookup.request(st.session_state.last_emotion).result()
+            track = tracks[0] if tracks else None
+            if track is None:
                 raise Exception("No video found in search results")
                 
-            video_id = match.group(1)
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
+            video_url = track.url
             
             st.video(video_url)
             logger.info(f"Playing YouTube video: {video_url}")
@@ -1,17 +1,20 @@
-from streamlit_webrtc import webrtc_streamer, VideoTransformerBase
+from streamlit_webrtc import webrtc_streamer
 import streamlit as st
-import cv2
-from keras.models import load_model
-import numpy as np
 import requests
-import re
-import time
-from urllib.parse import quote_plus
+import os
+import sys
 
-# Load model and labels
-model = load_model("code/model/fer2013_mini_XCEPTION.102-0.66.hdf5")
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import MoodLookup, enable_metrics, get_music_lookup
+from engine.webrtc import EmotionVideoProcessor, follow_mood
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Songs for every emotion are looked up once per process in the background and cached
+MUSIC_QUERY = '{emotion} background tunes'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
 
 # App config
 st.set_page_config(page_title="Emotion-Based Music Player", layout="centered")
@@ -53,32 +56,9 @@ if "last_emotion" not in st.session_state:
     st.session_state.last_emotion = "Neutral"
 if "show_video" not in st.session_state:
     st.session_state.show_video = False
-
-# Streamlit WebRTC Video Transformer
-class EmotionDetector(VideoTransformerBase):
-    def __init__(self):
-        self.last_emotion = "Neutral"
-
-    def transform(self, frame):
-        img = frame.to_ndarray(format="bgr24")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
-        for (x, y, w, h) in faces:
-            roi_gray = gray[y:y+h, x:x+w]
-            roi_gray = cv2.resize(roi_gray, (64, 64))
-            roi = roi_gray.astype("float") / 255.0
-            roi = np.expand_dims(roi, axis=0)
-            roi = np.expand_dims(roi, axis=-1)
-            preds = model.predict(roi)[0]
-            self.last_emotion = emotions[np.argmax(preds)]
-            st.session_state.last_emotion = self.last_emotion
-
-            cv2.rectangle(img, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(img, self.last_emotion, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
-            break
-
-        return img
+if "song_lookup" not in st.session_state:
+    # Song lookups run in the background, a newer mood cancels the lookup for the previous one
+    st.session_state.song_lookup = MoodLookup(music, MUSIC_QUERY, timeout=10.0)
 
 # 🎥 Live Camera Detection Mode
 if not st.session_state.show_video:
@@ -91,7 +71,7 @@ if not st.session_state.show_video:
     with col2:
         ctx = webrtc_streamer(
             key="emotion",
-            video_transformer_factory=EmotionDetector,
+            video_processor_factory=lambda: EmotionVideoProcessor(MUSIC_QUERY),
             rtc_configuration={
                 "iceServers": [
                     {"urls": ["stun:stun.l.google.com:19302"]},
@@ -107,11 +87,15 @@ if not st.session_state.show_video:
         )
 
     if capture:
-        if ctx.video_transformer:
-            st.session_state.last_emotion = ctx.video_transformer.last_emotion
+        if ctx.video_processor:
+            st.session_state.last_emotion = ctx.video_processor.last_emotion
             st.session_state.show_video = True
             st.rerun()
 
+    # Show the mood published by the inference worker while the camera runs and start its song lookup
+    if ctx.state.playing:
+        follow_mood(ctx, st.session_state.song_lookup, st.empty())
+
 # 🎧 Play Song For Detected Mood
 if st.session_state.show_video:
     st.markdown(f"## 🎧 Choose a {st.session_state.last_emotion} song to play")
@@ -121,28 +105,27 @@ if st.session_state.show_video:
         st.session_state.show_video = False
         st.rerun()
 
-    search_query = f"https://www.youtube.com/results?search_query={quote_plus(st.session_state.last_emotion + ' background tunes')}"
-    response = requests.get(search_query)
+    try:
+        # Top 5 unique videos, cached per emotion
+        with st.spinner("Finding songs for your mood..."):
+            tracks = st.session_state.song_lookup.request(st.session_state.last_emotion).result()
+    except (requests.RequestException, TimeoutError):
+        tracks = None
 
-    if response.status_code != 200:
+    if tracks is None:
         st.error("Failed to retrieve YouTube search results.")
     else:
-        html_content = response.text
-        video_ids = re.findall(r'/watch\?v=([^"]{11})', html_content)
-        unique_ids = list(dict.fromkeys(video_ids))[:5]  # Top 5 unique videos
-
-        if unique_ids:
-            cols = st.columns(len(unique_ids))
-            for i, video_id in enumerate(unique_ids):
+        if tracks:
+            cols = st.columns(len(tracks))
+            for i, track in enumerate(tracks):
                 with cols[i]:
-                    video_url = f"https://www.youtube.com/watch?v={video_id}"
-                    thumbnail_url = f"https://img.youtube.com/vi/{video_id}/0.jpg"
+                    thumbnail_url = f"https://img.youtube.com/vi/{track.video_id}/0.jpg"
                     try:
                         st.image(thumbnail_url, use_container_width=True)
                     except TypeError:
                         st.image(thumbnail_url)
-                    if st.button(f"▶️ Play {i+1}", key=video_id):
-                        st.session_state.selected_video = video_url
+                    if st.button(f"▶️ Play {i+1}", key=track.video_id):
+                        st.session_state.selected_video = track.url
 
             if "selected_video" in st.session_state:
                 st.video(st.session_state.selected_video)
@@ -1,14 +1,22 @@
 import streamlit as st
 import cv2
-from keras.models import load_model
-import numpy as np
 import requests
-import re
+import os
+import sys
 import time
 
-model = load_model("code/model/fer2013_mini_XCEPTION.102-0.66.hdf5")
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (MoodLookup, draw_predictions, enable_metrics, get_engine, get_music_lookup,
+                    get_prefetcher, primary_prediction)
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Songs for every emotion are looked up once per process in the background and cached
+MUSIC_QUERY = '{emotion} relaxing music'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
+
 st.markdown("""
 <style>
 :root {
@@ -74,22 +82,19 @@ if "last_emotion" not in st.session_state:
     st.session_state.last_emotion = "Neutral"
 if "show_video" not in st.session_state:
     st.session_state.show_video = False
+if "song_lookup" not in st.session_state:
+    # Song lookups run in the background, a newer mood cancels the lookup for the previous one
+    st.session_state.song_lookup = MoodLookup(music, MUSIC_QUERY, timeout=10.0)
 
 def detect_emotion(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5)
     emotion = st.session_state.last_emotion
-    for (x, y, w, h) in faces:
-        roi_gray = gray[y:y+h, x:x+w]
-        roi_gray = cv2.resize(roi_gray, (64, 64))
-        roi = roi_gray.astype("float") / 255.0
-        roi = np.expand_dims(roi, axis=0)
-        roi = np.expand_dims(roi, axis=-1)
-        preds = model.predict(roi)[0]
-        emotion = emotions[np.argmax(preds)]
-        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-        cv2.putText(frame, emotion, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
-        break
+    predictions = get_engine().predict_frame(frame)
+    if predictions:
+        primary = primary_prediction(predictions)
+        emotion = primary.label
+        # Warm songs for the likeliest moods (dominant and runner-up) before one is captured
+        get_prefetcher(MUSIC_QUERY).observe(primary.probs)
+        draw_predictions(frame, predictions, color=(0, 255, 0), text_color=(36, 255, 12))
     return frame, emotion
 
 if not st.session_state.show_video:
@@ -113,6 +118,8 @@ if not st.session_state.show_video:
         frame = cv2.resize(frame, (340, 260))
         frame, detected_emotion = detect_emotion(frame)
         st.session_state.last_emotion = detected_emotion
+        # Find a song for the current mood while the feed keeps running
+        st.session_state.song_lookup.request(detected_emotion)
 
         BADGE_GRADIENTS = {
             "Happy": "linear-gradient(90deg, #f9d423, #ff4e50)",
@@ -156,16 +163,14 @@ if st.session_state.show_video:
         st.session_state.show_video = False
         st.rerun()
 
-    query = f"https://www.youtube.com/results?search_query={st.session_state.last_emotion}+relaxing+music"
-    response = requests.get(query)
-    if response.status_code == 200:
-        match = re.search(r'/watch\?v=([^"]+)', response.text)
-        if match:
-            video_id = match.group(1)
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            st.video(video_url)
-        else:
-            st.error("Unable to fetch music. Please check your connection.")
+    try:
+        with st.spinner("Finding a song for your mood..."):
+            tracks = st.session_state.song_lookup.request(st.session_state.last_emotion).result()
+        track = tracks[0] if tracks else None
+    except (requests.RequestException, TimeoutError):
+        track = None
+    if track:
+        st.video(track.url)
     else:
         st.error("Unable to fetch music. Please check your connection.")
 
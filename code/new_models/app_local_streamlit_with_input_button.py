@@ -1,15 +1,21 @@
 import streamlit as st
 import cv2
-from keras.models import load_model
-import numpy as np
 import requests
-import re
+import os
+import sys
 import time
 
-# Load model and labels
-model = load_model("code/model/fer2013_mini_XCEPTION.102-0.66.hdf5")
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (EMOTIONS, MoodLookup, draw_predictions, enable_metrics, get_engine, get_music_lookup,
+                    get_prefetcher, primary_prediction)
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Songs for every emotion are looked up once per process in the background and cached
+MUSIC_QUERY = '{emotion} background tunes'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
 
 # App config
 st.set_page_config(page_title="Emotion-Based Music Player", layout="centered")
@@ -50,36 +56,30 @@ if "last_emotion" not in st.session_state:
     st.session_state.last_emotion = "Neutral"
 if "mode" not in st.session_state:
     st.session_state.mode = "input"  # can be 'input' or 'video'
+if "song_lookup" not in st.session_state:
+    # Song lookups run in the background, a newer mood cancels the lookup for the previous one
+    st.session_state.song_lookup = MoodLookup(music, MUSIC_QUERY, timeout=10.0)
 
 # Emotion detection function
 def detect_emotion(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
     emotion = st.session_state.last_emotion
-    for (x, y, w, h) in faces:
-        roi_gray = gray[y:y+h, x:x+w]
-        roi_gray = cv2.resize(roi_gray, (64, 64))
-        roi = roi_gray.astype("float") / 255.0
-        roi = np.expand_dims(roi, axis=0)
-        roi = np.expand_dims(roi, axis=-1)
-        preds = model.predict(roi)[0]
-        emotion = emotions[np.argmax(preds)]
-        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-        cv2.putText(frame, emotion, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
-        break
+    predictions = get_engine().predict_frame(frame)
+    if predictions:
+        primary = primary_prediction(predictions)
+        emotion = primary.label
+        # Warm songs for the likeliest moods (dominant and runner-up) before one is captured
+        get_prefetcher(MUSIC_QUERY).observe(primary.probs)
+        draw_predictions(frame, predictions, color=(0, 255, 0), text_color=(36, 255, 12))
     return frame, emotion
 
 # YouTube search function
 def search_youtube_video(emotion):
-    search_query = f"https://www.youtube.com/results?search_query={emotion}+background+tunes"
-    response = requests.get(search_query)
-    if response.status_code != 200:
+    try:
+        with st.spinner("Finding a song..."):
+            tracks = st.session_state.song_lookup.request(emotion).result()
+    except (requests.RequestException, TimeoutError):
         return None
-    match = re.search(r'/watch\?v=[\w-]+', response.text)
-    if match:
-        return f"https://www.youtube.com{match.group()}"
-    return None
+    return tracks[0].url if tracks else None
 
 # -----------------------
 # 🎛️ Mode Switch Buttons
@@ -99,7 +99,7 @@ with col1:
 # 🎚️ INPUT MODE (Default)
 # -------------------------
 if st.session_state.mode == "input":
-    input = st.selectbox("🎯 Select Emotion", emotions, index=0)
+    input = st.selectbox("🎯 Select Emotion", EMOTIONS, index=0)
     if st.button("🔍 Search Music for Selected Emotion"):
         video_url = search_youtube_video(input)
         if video_url:
@@ -135,6 +135,8 @@ if st.session_state.mode == "video":
         frame = cv2.resize(frame, (320, 240))
         frame, detected_emotion = detect_emotion(frame)
         st.session_state.last_emotion = detected_emotion
+        # Find a song for the current mood while the feed keeps running
+        st.session_state.song_lookup.request(detected_emotion)
 
         emotion_colors = {
             "Happy": "#DFF2BF",
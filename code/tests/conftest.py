@@ -0,0 +1,5 @@
+# Make the shared engine package (code/engine) importable from the tests
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,161 @@
+# Tests of the streaming video ID extractor against saved results pages served
+# from a local HTTP server. The pages in fixtures/youtube are:
+#   results.html           20 results (plus one repeated video) after ~90 KB of scripts
+#   results_truncated.html the download ends inside the fourth result's watch URL
+#   results_split.html     every watch URL straddles a 16 KB chunk boundary
+#   results_no_ids.html    the page shown when nothing matches the query
+# Run with: python -m pytest code/tests
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from engine.music import VIDEO_ID_PATTERN, YouTubeSearchProvider, create_session, extract_video_ids, watch_url
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'youtube')
+CHUNK_SIZE = 16384
+
+FIRST_RESULTS = ['pTyGJMuHbEI', '31IeL2HPcHw', 'GcFRl1SPnXM', 'YvMIHa_2o74', 'umfXfKm_r5k']
+TRUNCATED_RESULTS = ['Udhks8fNndg', 'PjHXSdXfRF8', 'u37Cig8TYGA']
+SPLIT_RESULTS = ['JVYCTeny9Us', 'bVTWNa4pS7A', 'MRVr1hyO2WU', 'BsTdyfy7L4A', 'uuJxTyGE_nA', 'Tt593dSWvM4']
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name + '.html'), 'rb') as f:
+        return f.read()
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def full_scan(data):
+    """Unique IDs of a whole page in order, the result streaming has to reproduce."""
+    return list(dict.fromkeys(match.decode('ascii') for match in VIDEO_ID_PATTERN.findall(data)))
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # The search query names the fixture page to serve
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('search_query', [''])[0]
+        path = os.path.join(FIXTURES, os.path.basename(query) + '.html')
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except ConnectionError:
+            # The streaming client hangs up as soon as it has enough IDs
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def search_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/results"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def counted_provider(search_url):
+    """A provider for the local server and a list holding the number of body bytes it read."""
+    read = [0]
+
+    def count_body(response, *args, **kwargs):
+        iter_content = response.iter_content
+
+        def counted(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                read[0] += len(chunk)
+                yield chunk
+
+        response.iter_content = counted
+
+    session = create_session()
+    session.hooks['response'].append(count_body)
+    yield YouTubeSearchProvider(search_url, session=session, chunk_size=CHUNK_SIZE), read
+    session.close()
+
+
+def test_search_stops_reading_once_enough_ids_are_found(counted_provider):
+    provider, read = counted_provider
+    page = read_fixture('results')
+    tracks = provider.search('results', limit=5)
+    assert [track.video_id for track in tracks] == FIRST_RESULTS
+    assert [track.url for track in tracks] == [watch_url(video_id) for video_id in FIRST_RESULTS]
+    # Reading stops within a chunk of the fifth result's watch URL, long before the end of the page
+    last_end = page.index(b'/watch?v\\u003d' + FIRST_RESULTS[-1].encode()) + len('/watch?v\\u003d') + 11
+    assert last_end < read[0] <= last_end + 2 * CHUNK_SIZE
+    assert read[0] < len(page)
+
+
+def test_search_reads_whole_page_when_it_has_too_few_ids(counted_provider):
+    provider, read = counted_provider
+    page = read_fixture('results')
+    video_ids = [track.video_id for track in provider.search('results', limit=50)]
+    assert video_ids[:5] == FIRST_RESULTS
+    # 21 results, one of them a repeat
+    assert len(video_ids) == 20
+    assert video_ids == full_scan(page)
+    assert read[0] == len(page)
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('results_truncated', TRUNCATED_RESULTS),
+    ('results_split', SPLIT_RESULTS),
+    ('results_no_ids', []),
+])
+def test_search_fixture_pages(counted_provider, name, expected):
+    provider, read = counted_provider
+    assert [track.video_id for track in provider.search(name, limit=10)] == expected
+    assert read[0] == len(read_fixture(name))
+
+
+@pytest.mark.parametrize('name', ['results', 'results_truncated', 'results_split', 'results_no_ids'])
+@pytest.mark.parametrize('chunk_size', [1, 7, 31, 32, 33, 4096, CHUNK_SIZE])
+def test_streaming_matches_full_scan(name, chunk_size):
+    page = read_fixture(name)
+    assert extract_video_ids(chunked(page, chunk_size), limit=100) == full_scan(page)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 65))
+def test_edge_cases_split_at_every_offset(chunk_size):
+    ids = ['dQw4w9WgXcQ', 'a-b_c0d1e2E', 'ZZZZZZZZZZ8', '0123456789k']
+    page = (b'<a href="/watch?v=' + ids[0].encode() + b'">'
+            # Escaped URL inside the JSON that holds the results
+            + b'"url":"/watch?v\\u003d' + ids[1].encode() + b'\\u0026pp=x",'
+            # Over-long token and an 11th character a real ID cannot end with, both ignored
+            + b'/watch?v=' + b'A' * 12 + b'"/watch?v=AAAAAAAAAAB"'
+            # Duplicates count once
+            + b'/watch?v=' + ids[0].encode() + b'&list=1 /watch?v=' + ids[2].encode() + b'"'
+            # The last ID ends the stream, it is only seen after the final chunk
+            + b'/watch?v=' + ids[3].encode())
+    assert extract_video_ids(chunked(page, chunk_size), limit=10) == ids
+    assert extract_video_ids(chunked(page, chunk_size), limit=2) == ids[:2]
+    # An over-long token split at any point must not yield its first 11 characters
+    assert extract_video_ids(chunked(b'/watch?v=' + b'B' * 16 + b'"', chunk_size)) == []
+
+
+def test_stops_consuming_chunks_after_the_limit():
+    consumed = []
+
+    def chunks():
+        for chunk in [b'/watch?v=dQw4w9WgXcQ ', b'/watch?v=ZZZZZZZZZZ8 '] + [b'x' * 100] * 5:
+            consumed.append(chunk)
+            yield chunk
+
+    assert extract_video_ids(chunks(), limit=2) == ['dQw4w9WgXcQ', 'ZZZZZZZZZZ8']
+    assert len(consumed) == 2
@@ -0,0 +1,144 @@
+# Annotates recorded media with the emotion of every face, without a camera or a window.
+# Inputs can be video files, images or folders of images; results are streamed
+# to the output file as frames are processed (JSONL, CSV or Parquet).
+# Usage: python code/tools/annotate_media.py videos/session1.mp4 frames/ -o results.jsonl
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import EMOTIONS, annotate_media, get_engine
+
+FACE_COLUMNS = ['source', 'frame', 'timestamp_ms', 'face', 'x', 'y', 'w', 'h', 'emotion'] + \
+               [f'p_{emotion.lower()}' for emotion in EMOTIONS]
+
+
+def face_rows(annotation):
+    for i, prediction in enumerate(annotation.predictions):
+        x, y, w, h = prediction.box
+        yield [annotation.source, annotation.frame_index, annotation.timestamp, i, x, y, w, h, prediction.label] + \
+              [round(float(p), 5) for p in prediction.probs]
+
+
+class JsonlWriter:
+    """One line per frame, frames without faces are kept with an empty list."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, annotation):
+        self.file.write(json.dumps({
+            'source': annotation.source,
+            'frame': annotation.frame_index,
+            'timestamp_ms': annotation.timestamp,
+            'faces': [{
+                'box': list(prediction.box),
+                'emotion': prediction.label,
+                'probs': dict(zip(EMOTIONS, (round(float(p), 5) for p in prediction.probs))),
+            } for prediction in annotation.predictions],
+        }) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    """One row per face."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FACE_COLUMNS)
+
+    def write(self, annotation):
+        self.writer.writerows(face_rows(annotation))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """One row per face, written in row groups of `rows_per_group` rows."""
+
+    def __init__(self, path, rows_per_group=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+        self.pa = pa
+        self.pq = pq
+        # Fixed schema: image rows have no timestamp, so inferring it from the first row group
+        # would make the file's types depend on the order of the inputs
+        self.schema = pa.schema(
+            [('source', pa.string()), ('frame', pa.int64()), ('timestamp_ms', pa.float64()), ('face', pa.int32())] +
+            [(name, pa.int32()) for name in ('x', 'y', 'w', 'h')] +
+            [('emotion', pa.string())] +
+            [(name, pa.float32()) for name in FACE_COLUMNS[9:]])
+        self.writer = None
+        self.path = path
+        self.rows = []
+        self.rows_per_group = rows_per_group
+
+    def write(self, annotation):
+        self.rows.extend(face_rows(annotation))
+        if len(self.rows) >= self.rows_per_group:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pa.table({name: list(column) for name, column in zip(FACE_COLUMNS, zip(*self.rows))},
+                              schema=self.schema)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {'.jsonl': JsonlWriter, '.csv': CsvWriter, '.parquet': ParquetWriter}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotate videos and images with facial emotions')
+    parser.add_argument('inputs', nargs='+', help='video files, images or image folders')
+    parser.add_argument('-o', '--output', required=True, help='output file (.jsonl, .csv or .parquet)')
+    parser.add_argument('--backend', default=None, help='keras, onnx or tflite (defaults to EMOTION_BACKEND)')
+    parser.add_argument('--workers', type=int, default=None, help='detection threads (defaults to the core count)')
+    parser.add_argument('--batch-size', type=int, default=64, help='faces per model call')
+    parser.add_argument('--stride', type=int, default=1, help='only process every n-th frame')
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension not in WRITERS:
+        parser.error(f"unsupported output format {extension!r}, use one of {', '.join(WRITERS)}")
+
+    writer = WRITERS[extension](args.output)
+    frames = faces = 0
+    start = time.perf_counter()
+    try:
+        for annotation in annotate_media(args.inputs, get_engine(args.backend), workers=args.workers,
+                                         batch_size=args.batch_size, stride=args.stride):
+            writer.write(annotation)
+            frames += 1
+            faces += len(annotation.predictions)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"Annotated {frames} frames, {faces} faces in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed else 0:.1f} frames/s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Ingests a track list with audio features into the offline music catalog
+# index (see code/engine/catalog.py) and saves it as a compact .npz file.
+# The input is a CSV or JSON file with one track per row/object and at least
+# valence and energy columns in [0, 1]; tempo (BPM), id, title, artist and url
+# are used when present.
+# Usage: python code/tools/build_catalog.py tracks.csv --output code/model/catalog.npz
+import argparse
+import os
+import sys
+import time
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine.catalog import MusicCatalog, read_tracks
+from engine.config import EMOTIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the offline music catalog index')
+    parser.add_argument('tracks', help='CSV or JSON track list with valence/energy(/tempo) features')
+    parser.add_argument('--output', required=True, help='where to save the .npz index')
+    parser.add_argument('--grid', type=int, default=64, help='index cells per axis')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = read_tracks(args.tracks)
+    catalog = MusicCatalog.from_rows(rows, grid=args.grid)
+    catalog.save(args.output)
+    print(f"Indexed {len(catalog)} of {len(rows)} tracks in {time.perf_counter() - start:.1f}s -> {args.output}")
+    if len(catalog) < len(rows):
+        print(f"Skipped {len(rows) - len(catalog)} tracks without valence or energy")
+
+    for emotion in EMOTIONS:
+        tracks = catalog.recommend(emotion, k=3)
+        print(f"{emotion:<9}" + '; '.join(f"{t.title or t.track_id} ({t.artist})" for t in tracks))
+
+
+if __name__ == '__main__':
+    main()
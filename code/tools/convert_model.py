@@ -0,0 +1,78 @@
+# Exports the hdf5 emotion model to ONNX and/or TFLite so the apps can run
+# without TensorFlow (see engine/backends.py), and checks that the exported
+# models agree with Keras.
+# Usage: python code/tools/convert_model.py --onnx --tflite
+import argparse
+import os
+import sys
+
+import numpy as np
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine.backends import ONNX_MODEL_PATH, TFLITE_MODEL_PATH, KerasBackend, load_backend
+from engine.config import INPUT_SHAPE, MODEL_PATH
+
+
+def export_onnx(model, output_path, opset=13):
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError as e:
+        raise ImportError("Exporting to ONNX needs tf2onnx: pip install tf2onnx") from e
+
+    spec = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+
+
+def export_tflite(model, output_path):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def check_backend(name, model_path, reference, rois, atol):
+    """Compare a converted backend against the Keras outputs, returns True when they match."""
+    probs = load_backend(name, model_path)(rois)
+    max_diff = float(np.abs(probs - reference).max())
+    agreement = float((probs.argmax(axis=1) == reference.argmax(axis=1)).mean())
+    ok = max_diff <= atol
+    print(f"{name:<7} max abs diff {max_diff:.2e}  top-1 agreement {agreement:.1%}  {'OK' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the emotion model for the onnx and tflite backends')
+    parser.add_argument('--model', default=MODEL_PATH, help='hdf5 model to convert')
+    parser.add_argument('--onnx', nargs='?', const=ONNX_MODEL_PATH, help='write an ONNX model (optionally to this path)')
+    parser.add_argument('--tflite', nargs='?', const=TFLITE_MODEL_PATH, help='write a TFLite model (optionally to this path)')
+    parser.add_argument('--samples', type=int, default=256, help='random inputs used to compare the backends')
+    parser.add_argument('--atol', type=float, default=1e-4, help='allowed absolute difference in probabilities')
+    args = parser.parse_args()
+
+    if not args.onnx and not args.tflite:
+        parser.error('nothing to do, pass --onnx and/or --tflite')
+
+    keras_backend = KerasBackend(args.model)
+    exported = []
+    if args.onnx:
+        export_onnx(keras_backend.model, args.onnx)
+        exported.append(('onnx', args.onnx))
+        print("Wrote", args.onnx)
+    if args.tflite:
+        export_tflite(keras_backend.model, args.tflite)
+        exported.append(('tflite', args.tflite))
+        print("Wrote", args.tflite)
+
+    rois = np.random.default_rng(0).random((args.samples,) + INPUT_SHAPE, dtype=np.float32)
+    reference = keras_backend(rois)
+    results = [check_backend(name, path, reference, rois, args.atol) for name, path in exported]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
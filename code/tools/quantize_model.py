@@ -0,0 +1,148 @@
+# Produces post-training quantized TFLite variants of the emotion model and
+# reports how close they stay to the float model and how fast they run.
+#   dynamic: int8 weights, float activations (no calibration needed)
+#   int8:    int8 weights and activations, calibrated on real face crops
+# Usage: python code/tools/quantize_model.py --calibration faces/ --eval faces_eval/
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1')
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine.backends import KerasBackend, TFLiteBackend, tflite_model_paths
+from engine.config import MODEL_PATH
+from engine.inference import FacialEmotionEngine
+from engine.offline import list_images
+
+
+def load_face_crops(engine, directory, detect=False, limit=None):
+    """Load the images of a directory as model inputs of shape (N, 64, 64, 1).
+
+    Images are expected to be face crops; with detect=True the faces are
+    first found with the engine's Haar cascade and every face becomes one
+    input. Crops go through the engine's own preprocessing, so calibration
+    sees exactly what inference does.
+    """
+    batches = []
+    count = 0
+    for path in list_images(directory):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        boxes = engine.detect_faces(gray) if detect else [(0, 0, gray.shape[1], gray.shape[0])]
+        if len(boxes) == 0:
+            continue
+        # preprocess_batch fills a buffer that the next call overwrites
+        batches.append(engine.preprocess_batch(gray, boxes).copy())
+        count += len(boxes)
+        if limit and count >= limit:
+            break
+    if not batches:
+        raise SystemExit(f"No usable images found in {directory}")
+    rois = np.concatenate(batches)
+    return rois[:limit] if limit else rois
+
+
+def convert(model, output_path, mode, calibration=None):
+    """Write a TFLite model, mode is 'float', 'dynamic' or 'int8' (needs calibration crops)."""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if mode != 'float':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        def representative_dataset():
+            for roi in calibration:
+                yield [roi[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def latency_ms(backend, roi, runs, warmup=10):
+    """Median latency of classifying one face, in milliseconds."""
+    for _ in range(warmup):
+        backend(roi)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend(roi)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the emotion model and report accuracy/latency')
+    parser.add_argument('--model', default=MODEL_PATH, help='hdf5 model to quantize')
+    parser.add_argument('--calibration', required=True, help='directory of face crops used to calibrate int8')
+    parser.add_argument('--eval', help='directory of face crops used for the report (defaults to --calibration)')
+    parser.add_argument('--detect', action='store_true', help='images are full frames, crop faces with the cascade')
+    parser.add_argument('--calibration-size', type=int, default=300, help='maximum number of calibration crops')
+    parser.add_argument('--runs', type=int, default=200, help='timed single-face inferences per model')
+    parser.add_argument('--threads', type=int, default=1, help='TFLite interpreter threads')
+    parser.add_argument('--report', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+
+    keras_backend = KerasBackend(args.model)
+    # Only used for its face detection and preprocessing, with the default Haar cascade
+    engine = FacialEmotionEngine(keras_backend, detector='haar')
+    calibration = load_face_crops(engine, args.calibration, args.detect, args.calibration_size)
+    evaluation = load_face_crops(engine, args.eval, args.detect) if args.eval else calibration
+    print(f"Calibration crops: {len(calibration)}, evaluation crops: {len(evaluation)}")
+
+    # The float TFLite model is the baseline that separates converter effects from quantization,
+    # an export older than the hdf5 model is stale and written again
+    float_path, dynamic_path, int8_path = tflite_model_paths(args.model)
+    if not os.path.exists(float_path) or os.path.getmtime(float_path) < os.path.getmtime(args.model):
+        convert(keras_backend.model, float_path, 'float')
+    convert(keras_backend.model, dynamic_path, 'dynamic')
+    convert(keras_backend.model, int8_path, 'int8', calibration)
+
+    reference = keras_backend(evaluation)
+    single = evaluation[:1]
+    rows = [{
+        'model': 'keras float32',
+        'path': args.model,
+        'size_kb': os.path.getsize(args.model) / 1024,
+        'top1_agreement': 1.0,
+        'max_abs_diff': 0.0,
+        'latency_ms': latency_ms(keras_backend, single, args.runs),
+    }]
+    for name, path in [('tflite float32', float_path),
+                       ('tflite dynamic', dynamic_path),
+                       ('tflite int8', int8_path)]:
+        backend = TFLiteBackend(path, num_threads=args.threads)
+        probs = np.concatenate([backend(evaluation[i:i + 1]) for i in range(len(evaluation))])
+        rows.append({
+            'model': name,
+            'path': path,
+            'size_kb': os.path.getsize(path) / 1024,
+            'top1_agreement': float((probs.argmax(axis=1) == reference.argmax(axis=1)).mean()),
+            'max_abs_diff': float(np.abs(probs - reference).max()),
+            'latency_ms': latency_ms(backend, single, args.runs),
+        })
+
+    print(f"{'model':<16}{'size (KB)':>11}{'top-1 agree':>13}{'max |diff|':>12}{'ms/face':>10}")
+    for row in rows:
+        print(f"{row['model']:<16}{row['size_kb']:>11.0f}{row['top1_agreement']:>13.1%}"
+              f"{row['max_abs_diff']:>12.4f}{row['latency_ms']:>10.3f}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'evaluation_crops': len(evaluation), 'threads': args.threads, 'models': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,41 +2,44 @@
 #Importing the libraries
 import cv2
 import PySimpleGUI as sg
-from keras.models import load_model
-import numpy as np
 import webbrowser
 from threading import Thread
-import requests
-import re
-
-# Load the pre-trained facial expression recognition model
-model = load_model('code/model/fer2013_mini_XCEPTION.102-0.66.hdf5')
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-
-def detect_emotion(frame, face_cascade):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
-    for (x, y, w, h) in faces:
-        roi_gray = gray[y:y + h, x:x + w]
-        roi_gray = cv2.resize(roi_gray, (64, 64), interpolation=cv2.INTER_AREA)
-        roi = roi_gray / 255.0
-        roi = np.reshape(roi, (1, 64, 64, 1))
-        prediction = model.predict(roi)
-        emotion_label = emotions[np.argmax(prediction)]
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-        cv2.putText(frame, emotion_label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
-        return frame, emotion_label
+import os
+import sys
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (MoodLookup, draw_predictions, enable_metrics, get_engine, get_music_lookup,
+                    get_prefetcher, primary_prediction)
+
+# Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+enable_metrics()
+
+# Load the pre-trained facial expression recognition model and the face detector
+engine = get_engine()
+
+# Songs for every emotion are looked up in the background while the camera runs
+MUSIC_QUERY = '{emotion} weekend beats'
+music = get_music_lookup(prefetch_query=MUSIC_QUERY)
+
+def detect_emotion(frame):
+    predictions = engine.predict_frame(frame)
+    if predictions:
+        draw_predictions(frame, predictions, color=(255, 0, 0))
+        primary = primary_prediction(predictions)
+        # Warm songs for the likeliest moods (dominant and runner-up) before Play is pressed
+        get_prefetcher(MUSIC_QUERY).observe(primary.probs)
+        return frame, primary.label
     return None, None  # Return None when no faces are detected
 
 def video_thread(window):
     cap = cv2.VideoCapture(0)
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
     current_emotion = None
     while True:
         ret, frame = cap.read()
         if ret:
             frame = cv2.resize(frame, (640, 480))  # Resize frame for better performance
-            frame_with_faces, current_detected_emotion = detect_emotion(frame, face_cascade)
+            frame_with_faces, current_detected_emotion = detect_emotion(frame)
             if frame_with_faces is not None:
                 imgbytes = cv2.imencode('.png', frame_with_faces)[1].tobytes()
                 window['-IMAGE-'].update(data=imgbytes)
@@ -44,15 +47,15 @@ def video_thread(window):
                     window['-EMOTION-'].update(value=f'Detected Emotion: {current_detected_emotion}')
                     current_emotion = current_detected_emotion
 
-def play_song_with_emotion(emotion, window):
-    search_query = f"https://www.youtube.com/results?search_query={emotion}+weekend+beats"
-    response = requests.get(search_query)
-    html_content = response.text
-    match = re.search(r'/watch\?v=([^\"]+)', html_content)
-    if match:
-        video_id = match.group(1)
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        webbrowser.open(video_url)
+# Called in the GUI thread with the result of the background lookup for `emotion`
+def play_song_with_emotion(emotion, tracks, error, window):
+    if error is not None:
+        window['-RETURN-VALUE-'].update(value=f'Music lookup failed: {error}')
+    elif tracks:
+        webbrowser.open(tracks[0].url)
+        window['-RETURN-VALUE-'].update(value=f'Playing a {emotion} song')
+    else:
+        window['-RETURN-VALUE-'].update(value=f'No song found for {emotion}')
 
 def gui_thread():
     layout = [
@@ -67,6 +70,12 @@ def gui_thread():
 
     Thread(target=video_thread, args=(window,), daemon=True).start()
 
+    # Lookups never block the event loop, their results come back as -SONG- events
+    def on_song(emotion, tracks, error):
+        window.write_event_value('-SONG-', (emotion, tracks, error))
+
+    songs = MoodLookup(music, MUSIC_QUERY, timeout=10.0, callback=on_song)
+
     current_emotion = None  # Store the latest captured emotion
 
     while True:
@@ -77,8 +86,12 @@ def gui_thread():
             current_emotion = window['-EMOTION-'].DisplayText.split(":")[1].strip()
             window['-RETURN-VALUE-'].update(value=f'Detected Emotion: {current_emotion}')
         elif event == '-PLAY-' and current_emotion:
-            play_song_with_emotion(current_emotion, window)
+            window['-RETURN-VALUE-'].update(value=f'Finding a {current_emotion} song...')
+            songs.request(current_emotion)
+        elif event == '-SONG-':
+            play_song_with_emotion(*values['-SONG-'], window)
 
+    songs.cancel()
     window.close()
 
 if __name__ == "__main__":
@@ -1,40 +1,56 @@
 #This is the raw code without using any fancy GUI or web tool
+#Profile the loop over a fixed number of frames of a recording:
+#  python code/ui_interfaces/cli_main.py --profile --video clip.mp4 --frames 300 --trace trace.json
 #Importing the libraries
+import argparse
+import contextlib
+import cProfile
+import pstats
+import time
 import cv2
-from keras.models import load_model
-import numpy as np
 import webbrowser
 import requests
-import re
 import os
+import sys
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
-# Function to play the first song from youtube queries
-def play_first_song(final_emotion):
-    try:
-        search_query = f"https://www.youtube.com/results?search_query={final_emotion}+background+tunes"
-        
-        # to fetch the search results page
-        response = requests.get(search_query)
-        
-        # HTTP status code 200 = request was successful 
-        if response.status_code != 200:
-            print("Failed to retrieve YouTube search results. Status code:", response.status_code)
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import (EmotionSmoother, TraceRecorder, draw_predictions, enable_metrics, get_catalog,
+                    get_engine, get_music_lookup, get_prefetcher, primary_prediction, set_metrics)
+
+MUSIC_QUERY = '{emotion} background tunes'
+
+# Function to play the first song from youtube queries, or from the local catalog when there is one
+def play_first_song(final_emotion, final_probs=None):
+    if final_emotion is None:
+        # The video ended or the camera failed before a face was captured
+        print("No emotion was captured, nothing to play.")
+        return
+
+    if catalog is not None:
+        # Offline: the tracks closest to the captured mood (the full probability vector when known)
+        try:
+            tracks = catalog.recommend(final_probs if final_probs is not None else final_emotion, k=5)
+        except Exception as e:
+            print("An error occurred while searching the music catalog:", e)
             return
-        
-        html_content = response.text
-        
-        match = re.search(r'/watch\?v=([^\"]+)', html_content)
-        if match:
-            video_id = match.group(1)
-            #video_url = f"https://www.youtube.com/watch?v={video_id}"
-            video_url = f"https://www.youtube.com/watch?v={video_id.encode('utf-8').decode('unicode_escape')}"
-            
+        for track in tracks:
+            print(f"Recommended: {track.title} - {track.artist}")
+        playable = next((track for track in tracks if track.url), None)
+        if playable:
+            webbrowser.open(playable.url)
+        return
+
+    try:
+        # Usually already cached by the prefetch that started with the camera
+        track = get_music_lookup().first(final_emotion, MUSIC_QUERY)
+        if track:
             # printing the video URL for debugging purposes
-            print("Opening YouTube video:", video_url)
+            print("Opening YouTube video:", track.url)
             
             # opening the video in the default web browser
-            webbrowser.open(video_url)
+            webbrowser.open(track.url)
         else:
             print("No video found for the given query.")
 
@@ -43,20 +59,49 @@ def play_first_song(final_emotion):
     except Exception as e:
         print("An unexpected error occurred:", e)
     
-# Load the pre-trained facial expression recognition model
-model = load_model("code/model/fer2013_mini_XCEPTION.102-0.66.hdf5") 
-
-# Define the list of emotions
-emotions = ['Angry', 'Disgust', 'Fear', 'Happy', 'Sad', 'Surprise', 'Neutral']
-
-# Create a cascade classifier for detecting faces
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-
-# Open a connection to the camera (0 is usually the default camera)
-cap = cv2.VideoCapture(0)
-
-# Variable to store the final emotion
+parser = argparse.ArgumentParser(description='Detect your emotion from the webcam and play a matching song')
+parser.add_argument('--video', help='read frames from this recording instead of the camera')
+parser.add_argument('--profile', action='store_true',
+                    help='profile the loop with cProfile for --frames frames instead of playing a song')
+parser.add_argument('--frames', type=int, default=300, help='frames to run in profile mode')
+parser.add_argument('--trace', default='cli_trace.json', help='Chrome trace-event file written in profile mode')
+parser.add_argument('--profile-output', help='also save the raw cProfile stats to this file')
+parser.add_argument('--top', type=int, default=25, help='hot functions to list in profile mode')
+parser.add_argument('--headless', action='store_true', help='do not open a window (profile only the pipeline)')
+parser.add_argument('--catalog', help='recommend from this local track catalog (defaults to MUSIC_CATALOG)')
+args = parser.parse_args()
+
+# Local music catalog for offline recommendations, None when not configured
+catalog = get_catalog(args.catalog)
+
+if args.profile:
+    # Every stage timer of the pipeline becomes a span in the per-frame trace
+    recorder = set_metrics(TraceRecorder())
+else:
+    # Serve per-stage metrics for Prometheus when EMOTION_METRICS_PORT is set
+    enable_metrics()
+    # Look up songs for every emotion in the background while the camera runs
+    if catalog is None:
+        get_music_lookup(prefetch_query=MUSIC_QUERY)
+
+# Speculative lookups follow the live mood, not needed with the local catalog or while profiling
+prefetcher = get_prefetcher(MUSIC_QUERY) if catalog is None and not args.profile else None
+
+# Load the pre-trained facial expression recognition model and the face detector
+engine = get_engine()
+
+# Run the face detector every 10 frames and track the faces in between
+tracker = engine.create_tracker(detect_interval=10)
+
+# Smooth the predictions over time so the captured emotion is a stable mood, not a single frame
+smoother = EmotionSmoother()
+
+# Open a connection to the camera (0 is usually the default camera) or the recording
+cap = cv2.VideoCapture(args.video if args.video else 0)
+
+# Variable to store the final emotion and its probabilities
 final_emotion = None
+final_probs = None
 
 # Flag to indicate whether emotion capture has occurred
 emotion_captured = False
@@ -66,72 +111,92 @@ Flag_final = False
 
 # Callback function for mouse click
 def on_button_click(event, x, y, flags, param):
-    global final_emotion
+    global final_emotion, final_probs
     if event == cv2.EVENT_LBUTTONDOWN:
         final_emotion = emotion_label
+        final_probs = emotion_probs
         print("Final Emotion:", final_emotion)
         cap.release()
         cv2.destroyAllWindows()
         emotion_captured = True
 
 # Create a named window
-cv2.namedWindow('Facial Expression Recognition')
+if not args.headless:
+    cv2.namedWindow('Facial Expression Recognition')
 
-# Set the mouse callback function 
-cv2.setMouseCallback('Facial Expression Recognition', on_button_click)
+    # Set the mouse callback function 
+    cv2.setMouseCallback('Facial Expression Recognition', on_button_click)
 
+# Profile mode: cProfile and the frame trace cover exactly the frame loop
+frame_count = 0
+if args.profile:
+    profiler = cProfile.Profile()
+    loop_start = time.perf_counter()
+    profiler.enable()
 
 while True:
-    # Read a frame from the camera
-    ret, frame = cap.read()
-    #print("Read frame:", ret)
-
-    # Check if the emotion has been captured
-    if ret == False:
-        play_first_song(final_emotion)
+    if args.profile and frame_count >= args.frames:
         break
-        #print("breaking the loop")
-
-    # Convert the frame to grayscale for face detection
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-    # Detect faces in the frame
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
 
-    for (x, y, w, h) in faces:
-        # Extract the region of interest (ROI) which is the face
-        roi_gray = gray[y:y + h, x:x + w]
-        roi_gray = cv2.resize(roi_gray, (64, 64), interpolation=cv2.INTER_AREA)
-
-        # Normalize the pixel values
-        roi = roi_gray / 255.0
-
-        # Reshape the image for the model
-        roi = np.reshape(roi, (1, 64, 64, 1))
-
-        # Make a prediction using the pre-trained model
-        prediction = model.predict(roi)
-        emotion_label = emotions[np.argmax(prediction)]
-
-        # Draw a rectangle around the face and display the predicted emotion
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-        cv2.putText(frame, emotion_label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
-
-        # Display the button text
-        button_text = "Capture Emotion"
-        cv2.putText(frame, button_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-
-    # Display the frame
-    cv2.imshow('Facial Expression Recognition', frame)
-    #print("Display frame")
-
-    # Break the loop if the 'q' key is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-    #print("Key pressed")
+    # In profile mode every frame is one span; the with block also closes it on the break paths
+    with (recorder.span('frame', index=frame_count) if args.profile else contextlib.nullcontext()):
+        # Read a frame from the camera
+        if args.profile:
+            with recorder.span('capture'):
+                ret, frame = cap.read()
+        else:
+            ret, frame = cap.read()
+        #print("Read frame:", ret)
+
+        # Check if the emotion has been captured
+        if ret == False:
+            if not args.profile:
+                play_first_song(final_emotion, final_probs)
+            break
+            #print("breaking the loop")
+        frame_count += 1
+
+        # Detect the faces in the frame and predict all their emotions in one model call
+        predictions = smoother.update(engine.predict_frame(frame, tracker))
+
+        if predictions:
+            # The largest (closest) face decides the emotion that gets captured
+            primary = primary_prediction(predictions)
+            emotion_label = primary.label
+            emotion_probs = primary.probs
+            # Warm songs for the likeliest moods (dominant and runner-up) before one is captured
+            if prefetcher is not None:
+                prefetcher.observe(emotion_probs)
+
+            # Draw a rectangle around each face and display the predicted emotion
+            draw_predictions(frame, predictions, color=(255, 0, 0))
+
+            # Display the button text
+            button_text = "Capture Emotion"
+            cv2.putText(frame, button_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+
+        # Display the frame
+        if not args.headless:
+            cv2.imshow('Facial Expression Recognition', frame)
+            #print("Display frame")
+
+            # Break the loop if the 'q' key is pressed
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            #print("Key pressed")
 
 # Release the camera and close all OpenCV windows
 #print("About to release the camera and close windows")
 cap.release()
 cv2.destroyAllWindows()
+
+if args.profile:
+    profiler.disable()
+    elapsed = time.perf_counter() - loop_start
+    print(f"Profiled {frame_count} frames in {elapsed:.2f}s ({frame_count / elapsed:.1f} FPS)")
+    events = recorder.write(args.trace)
+    print(f"Wrote {events} trace events to {args.trace} (open in chrome://tracing or ui.perfetto.dev)")
+    if args.profile_output:
+        profiler.dump_stats(args.profile_output)
+    pstats.Stats(profiler).strip_dirs().sort_stats('cumulative').print_stats(args.top)
@@ -0,0 +1,123 @@
+#Headless multi-camera service: every source gets its own capture thread and
+#all of them share one batched inference worker (see code/engine/streams.py)
+#Usage:
+#  python code/ui_interfaces/stream_server.py 0 1 rtsp://127.0.0.1:8554/door videos/room.mp4
+#  python code/ui_interfaces/stream_server.py lobby=0 door=rtsp://127.0.0.1:8554/door --output-dir results/
+import argparse
+import json
+import os
+import queue
+import sys
+import time
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+# Make the shared engine package (code/engine) importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import MultiStreamServer, enable_metrics, get_engine
+
+
+def parse_sources(values):
+    """Turn 'name=source' or plain 'source' arguments into {stream_id: source}."""
+    sources = {}
+    for i, value in enumerate(values):
+        name, sep, source = value.partition('=')
+        # URLs contain '=' in their query string, only treat short names as stream ids
+        if sep and name.isidentifier():
+            sources[name] = source
+        else:
+            sources[str(i)] = value
+    return sources
+
+
+def to_record(result):
+    return {
+        'stream': result.stream_id,
+        'frame': result.frame_index,
+        'timestamp': result.timestamp,
+        'faces': [{
+            'id': prediction.face_id,
+            'box': list(prediction.box),
+            'emotion': prediction.label,
+            'probs': [round(float(p), 4) for p in prediction.probs],
+        } for prediction in result.predictions],
+    }
+
+
+def write_results(server, outputs):
+    """Write at most one pending result per stream, returns False when there was nothing to write."""
+    wrote = False
+    for stream_id in server.streams:
+        try:
+            result = server.output(stream_id).get_nowait()
+        except queue.Empty:
+            continue
+        wrote = True
+        line = json.dumps(to_record(result))
+        if stream_id in outputs:
+            outputs[stream_id].write(line + '\n')
+        else:
+            print(line, flush=True)
+    return wrote
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run emotion recognition on several video sources at once')
+    parser.add_argument('sources', nargs='+', help="camera index, video file or URL, optionally as name=source")
+    parser.add_argument('--backend', default=None, help='keras, onnx or tflite (defaults to EMOTION_BACKEND)')
+    parser.add_argument('--max-batch', type=int, default=32, help='maximum face crops per model call')
+    parser.add_argument('--max-wait-ms', type=float, default=10.0, help='maximum time a crop waits for a batch')
+    parser.add_argument('--detect-interval', type=int, default=10, help='frames between full face detections')
+    parser.add_argument('--tile-size', help="search frames larger than WxH (e.g. 640x640) in parallel tiles")
+    parser.add_argument('--tile-overlap', type=int, default=160, help='tile overlap, also the largest face a tile looks for')
+    parser.add_argument('--tile-workers', type=int, default=None, help='tile detection workers per stream')
+    parser.add_argument('--tile-mode', choices=['thread', 'process'], default='thread', help='tile worker pool type')
+    parser.add_argument('--output-dir', help='write one <stream>.jsonl file per stream instead of printing')
+    parser.add_argument('--loop', action='store_true', help='restart video files when they end')
+    parser.add_argument('--stats-every', type=float, default=10.0, help='seconds between throughput reports')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve Prometheus metrics on this port (defaults to EMOTION_METRICS_PORT)')
+    args = parser.parse_args()
+    enable_metrics(args.metrics_port)
+
+    detector_options = None
+    if args.tile_size:
+        detector_options = {
+            'tile_size': tuple(int(v) for v in args.tile_size.lower().split('x')),
+            'overlap': args.tile_overlap,
+            'workers': args.tile_workers,
+            'mode': args.tile_mode,
+        }
+
+    server = MultiStreamServer(parse_sources(args.sources), get_engine(args.backend),
+                               max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000.0,
+                               detect_interval=args.detect_interval, loop=args.loop,
+                               detector_options=detector_options)
+
+    outputs = {}
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        outputs = {stream_id: open(os.path.join(args.output_dir, f'{stream_id}.jsonl'), 'a')
+                   for stream_id in server.streams}
+
+    server.start()
+    last_stats = time.monotonic()
+    try:
+        while server.running():
+            if not write_results(server, outputs):
+                time.sleep(0.005)
+            if time.monotonic() - last_stats >= args.stats_every:
+                print(json.dumps({'stats': server.stats()}), file=sys.stderr, flush=True)
+                last_stats = time.monotonic()
+        # Flush what the streams produced right before they ended
+        while write_results(server, outputs):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        for f in outputs.values():
+            f.close()
+
+
+if __name__ == '__main__':
+    main()